@@ -0,0 +1,218 @@
+"""Downloads from a local fake Yandex with each engine and worker count.
+
+Scenario "keywords" runs YandexImagesDownloader end to end: search pages
+over HTTP, parsing and image downloads. Scenario "images" submits image
+urls straight to the engine, which is download_single_image for the sync
+and pool engines. Every run is a separate process, so peak RSS is its own.
+
+Usage: python benchmarks/bench_download.py [--engines sync,pool:4,async:32]
+           [--scenarios keywords,images] [--latency S] [--drip-rate R] ...
+"""
+import argparse
+import json
+import logging
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from fake_yandex import add_server_arguments, make_server
+from yandex_images_download.downloader import (DownloadOptions,
+                                               YandexImagesDownloader)
+from yandex_images_download.engine import make_engine
+from yandex_images_download.ratelimit import RateLimiter
+from yandex_images_download.serp import HttpSerpFetcher
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SCENARIOS = ["keywords", "images"]
+
+
+class TimingEngine():
+    """Wraps an engine to time every image from submit to result.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.failed = 0
+
+    def submit(self, *args, **kwargs):
+        start = time.perf_counter()
+        future = self.engine.submit(*args, **kwargs)
+        future.add_done_callback(lambda future: self.on_done(future, start))
+        return future
+
+    def on_done(self, future, start):
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(latency)
+            if future.result().status == "fail":
+                self.failed += 1
+
+    def close(self):
+        self.engine.close()
+
+
+def parse_engine(spec):
+    """Parses "sync", "pool:N" or "async:N" into (name, workers).
+    """
+    name, _, workers = spec.partition(":")
+    return name, int(workers) if workers else 0
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def peak_rss_mb():
+    """Returns peak RSS of this process and of its largest child, MB.
+    """
+    if resource is None:
+        return None, None
+
+    to_mb = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / to_mb,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / to_mb)
+
+
+def run_keywords(engine, args, output_directory):
+    YandexImagesDownloader.MAIN_URL = f"{args.url}/images/search"
+    downloader = YandexImagesDownloader(
+        None,
+        output_directory,
+        args.limit,
+        download_options=DownloadOptions(pool_maxsize=args.workers or 10),
+        engine=engine,
+        pipeline=args.pipeline,
+        serp_fetcher=HttpSerpFetcher(),
+        rate_limiter=RateLimiter(args.serp_rate))
+    downloader.download_images(
+        [f"keyword {i}" for i in range(args.keywords)])
+
+
+def run_images(engine, args, output_directory):
+    options = DownloadOptions(pool_maxsize=args.workers or 10)
+    futures = [
+        engine.submit(f"{args.url}/img/0/{i // 30}/{i % 30}.jpg",
+                      pathlib.Path(output_directory), "", options)
+        for i in range(args.keywords * args.limit)
+    ]
+    for future in futures:
+        future.result()
+
+
+def run_one(args):
+    """Runs one scenario against --url and prints its stats as JSON.
+    """
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    name, workers = parse_engine(args.engine)
+    engine = TimingEngine(
+        make_engine(name, workers, workers) if name != "sync" else
+        make_engine("pool", 0))
+    run = run_keywords if args.scenario == "keywords" else run_images
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        start = time.perf_counter()
+        try:
+            run(engine, args, output_directory)
+        finally:
+            engine.close()
+        total_time = time.perf_counter() - start
+
+    rss, workers_rss = peak_rss_mb()
+    print(
+        json.dumps({
+            "images": len(engine.latencies),
+            "failed": engine.failed,
+            "time": total_time,
+            "p50": percentile(engine.latencies, 50),
+            "p99": percentile(engine.latencies, 99),
+            "rss": rss,
+            "workers_rss": workers_rss
+        }))
+
+
+def format_mb(value):
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines",
+                        help="comma separated engines with worker counts."
+                        " default: sync,pool:4,pool:16,async:16,async:64",
+                        type=str,
+                        default="sync,pool:4,pool:16,async:16,async:64")
+    parser.add_argument("--scenarios",
+                        help="default: keywords,images",
+                        type=str,
+                        default=",".join(SCENARIOS))
+    parser.add_argument("--keywords", type=int, default=2)
+    parser.add_argument("--limit",
+                        help="images per keyword. default: 150",
+                        type=int,
+                        default=150)
+    parser.add_argument("--serp-rate",
+                        help="search pages per second. default: 1000",
+                        type=float,
+                        default=1000.0)
+    parser.add_argument("--pipeline",
+                        help="don't wait for a page before the next one",
+                        action="store_true")
+    add_server_arguments(parser)
+    # Internal: run a single scenario against a running fake server.
+    parser.add_argument("--run-one",
+                        action="store_true",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args)
+        return
+
+    print(f"{'scenario':<10}{'engine':<10}{'images':>8}{'failed':>8}"
+          f"{'img/s':>10}{'p50, ms':>10}{'p99, ms':>10}{'RSS, MB':>10}"
+          f"{'workers RSS':>13}")
+    with make_server(args) as fake:
+        for scenario in args.scenarios.split(","):
+            for spec in args.engines.split(","):
+                _, workers = parse_engine(spec)
+                output = subprocess.run([
+                    sys.executable, __file__, "--run-one", "--url", fake.url,
+                    "--engine", spec, "--scenario", scenario, "--workers",
+                    str(workers), "--keywords", str(args.keywords), "--limit",
+                    str(args.limit), "--serp-rate", str(args.serp_rate)
+                ] + (["--pipeline"] if args.pipeline else []),
+                                        check=True,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True).stdout
+                stats = json.loads(output.splitlines()[-1])
+
+                images_per_second = ((stats["images"] - stats["failed"]) /
+                                     stats["time"])
+                print(f"{scenario:<10}{spec:<10}{stats['images']:>8}"
+                      f"{stats['failed']:>8}{images_per_second:>10.1f}"
+                      f"{stats['p50'] * 1000:>10.1f}"
+                      f"{stats['p99'] * 1000:>10.1f}"
+                      f"{format_mb(stats['rss']):>10}"
+                      f"{format_mb(stats['workers_rss']):>13}")
+
+
+if __name__ == "__main__":
+    main()
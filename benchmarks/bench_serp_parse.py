@@ -0,0 +1,78 @@
+"""Compares parse_serp with the former BeautifulSoup parsing of SERP pages.
+
+The former approach parsed each page twice: once in check_captcha_and_get
+to look for the captcha, and once more for serp-list and serp-items.
+
+Usage: python benchmarks/bench_serp_parse.py [--number N]
+"""
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup
+from yandex_images_download.serp_parser import parse_serp
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / "fixtures"
+
+
+def parse_with_soup(page_source):
+    soup = BeautifulSoup(page_source, "lxml")
+    captcha = bool(soup.select(".form__captcha"))
+    if captcha:
+        return captcha, None, []
+
+    soup = BeautifulSoup(page_source, "lxml")
+    tag_serp_list = soup.find("div", class_="serp-list")
+    last_page = None
+    if tag_serp_list:
+        serp_list = json.loads(tag_serp_list.attrs["data-bem"])["serp-list"]
+        last_page = serp_list["lastPage"]
+    img_hrefs = [
+        json.loads(item.attrs["data-bem"])["serp-item"]["img_href"]
+        for item in soup.find_all("div", class_="serp-item")
+    ]
+
+    return captcha, last_page, img_hrefs
+
+
+def parse_fast(page_source):
+    serp_page = parse_serp(page_source)
+    return serp_page.captcha, serp_page.last_page, serp_page.img_hrefs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number",
+                        help="parses of each fixture. default: 50",
+                        type=int,
+                        default=50)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<24}{'soup, ms':>12}{'fast, ms':>12}{'speedup':>10}")
+    for path in sorted(FIXTURES.glob("*.html")):
+        page_source = path.read_text(encoding="utf-8")
+
+        expected = parse_with_soup(page_source)
+        actual = parse_fast(page_source)
+        if actual != expected:
+            sys.exit(f"{path.name}: results differ: {actual} != {expected}")
+
+        soup_time = min(
+            timeit.repeat(lambda: parse_with_soup(page_source),
+                          number=args.number,
+                          repeat=3)) / args.number
+        fast_time = min(
+            timeit.repeat(lambda: parse_fast(page_source),
+                          number=args.number,
+                          repeat=3)) / args.number
+
+        print(f"{path.name:<24}{soup_time * 1000:>12.2f}"
+              f"{fast_time * 1000:>12.2f}{soup_time / fast_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Local stand-in for Yandex Images search pages and the image CDN.
+
+Search pages are served at /images/search with the same serp-list and
+serp-item data-bem markup as yandex.ru, and point to images on the same
+server. Images have configurable latency, sizes, error rate and a share
+of slow-drip responses that send the body in small delayed chunks.
+
+Usage: python benchmarks/fake_yandex.py [--port PORT] [--latency S] ...
+"""
+import argparse
+import html
+import json
+import random
+import threading
+import time
+import zlib
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+
+class Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections of engines that
+    # open more at once, and their 1s SYN retransmits skew the results.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeYandex():
+    """Fake search and CDN server running in a background thread.
+
+    Every image url gets its own seeded random, so all runs against the
+    same settings see the same sizes, errors and slow-drip responses.
+    """
+
+    def __init__(self,
+                 port=0,
+                 images_per_page=30,
+                 pages=10,
+                 latency=0.02,
+                 jitter=0.01,
+                 min_size=20 * 1024,
+                 max_size=200 * 1024,
+                 error_rate=0.05,
+                 error_status=404,
+                 drip_rate=0.0,
+                 drip_delay=0.05,
+                 drip_chunk=4 * 1024):
+        self.images_per_page = images_per_page
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.min_size = min_size
+        self.max_size = max_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drip_rate = drip_rate
+        self.drip_delay = drip_delay
+        self.drip_chunk = drip_chunk
+
+        self.server = Server(("127.0.0.1", port), self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.url}/images/search"
+
+    def image_url(self, text, page, index) -> str:
+        return f"{self.url}/img/{zlib.crc32(text.encode())}/{page}/{index}.jpg"
+
+    def serp_html(self, text, page) -> str:
+        serp_list = {"serp-list": {"lastPage": self.pages - 1}}
+        items = []
+        for index in range(self.images_per_page):
+            img_href = self.image_url(text, page, index)
+            serp_item = {
+                "serp-item": {
+                    "img_href": img_href,
+                    "preview": [{
+                        "url": img_href,
+                        "w": 800,
+                        "h": 600,
+                        "fileSizeInBytes": self.max_size
+                    }],
+                    "thumb": {
+                        "url": img_href,
+                        "size": {
+                            "width": 200,
+                            "height": 150
+                        }
+                    }
+                }
+            }
+            items.append(
+                '<div class="serp-item serp-item_type_search"'
+                f' data-bem="{html.escape(json.dumps(serp_item))}">'
+                f'<img class="serp-item__thumb" src="{img_href}"></div>')
+
+        return ('<html><body><div class="serp-controller">'
+                '<div class="serp-list serp-list_type_search"'
+                f' data-bem="{html.escape(json.dumps(serp_list))}">'
+                f'{"".join(items)}</div></div></body></html>')
+
+    def image_response(self, path):
+        """Returns (status, body, slow_drip) for an image path.
+        """
+        rand = random.Random(zlib.crc32(path.encode()))
+        if rand.random() < self.error_rate:
+            return self.error_status, b"", False
+
+        size = rand.randint(self.min_size, self.max_size)
+        body = JPEG_HEADER + bytes(
+            rand.getrandbits(8) for _ in range(64)) * (size // 64 + 1)
+
+        return 200, body[:size], rand.random() < self.drip_rate
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, content_type, body, slow_drip=False):
+                try:
+                    self.write_body(status, content_type, body, slow_drip)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up, e.g. on a slow-drip response.
+                    pass
+
+            def write_body(self, status, content_type, body, slow_drip):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not slow_drip:
+                    self.wfile.write(body)
+                    return
+
+                for start in range(0, len(body), fake.drip_chunk):
+                    self.wfile.write(body[start:start + fake.drip_chunk])
+                    self.wfile.flush()
+                    time.sleep(fake.drip_delay)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/images/search":
+                    query = parse_qs(url.query)
+                    text = query.get("text", [""])[0]
+                    page = int(query.get("p", ["0"])[0])
+                    self.send_body(200, "text/html; charset=utf-8",
+                                   fake.serp_html(text, page).encode())
+                elif url.path.startswith("/img/"):
+                    time.sleep(
+                        max(0, fake.latency +
+                            random.uniform(-fake.jitter, fake.jitter)))
+                    status, body, slow_drip = fake.image_response(url.path)
+                    self.send_body(status, "image/jpeg", body, slow_drip)
+                else:
+                    self.send_body(404, "text/plain", b"")
+
+        return Handler
+
+    def start(self) -> "FakeYandex":
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--images-per-page", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency",
+                        help="image response latency, s. default: 0.02",
+                        type=float,
+                        default=0.02)
+    parser.add_argument("--jitter",
+                        help="random +- added to latency, s. default: 0.01",
+                        type=float,
+                        default=0.01)
+    parser.add_argument("--min-size", type=int, default=20 * 1024)
+    parser.add_argument("--max-size", type=int, default=200 * 1024)
+    parser.add_argument("--error-rate",
+                        help="share of failed images. default: 0.05",
+                        type=float,
+                        default=0.05)
+    parser.add_argument("--error-status", type=int, default=404)
+    parser.add_argument("--drip-rate",
+                        help="share of slow-drip images. default: 0",
+                        type=float,
+                        default=0.0)
+    parser.add_argument("--drip-delay",
+                        help="delay between slow-drip chunks, s."
+                        " default: 0.05",
+                        type=float,
+                        default=0.05)
+    parser.add_argument("--drip-chunk", type=int, default=4 * 1024)
+
+
+def make_server(args, port=0) -> FakeYandex:
+    return FakeYandex(port=port,
+                      images_per_page=args.images_per_page,
+                      pages=args.pages,
+                      latency=args.latency,
+                      jitter=args.jitter,
+                      min_size=args.min_size,
+                      max_size=args.max_size,
+                      error_rate=args.error_rate,
+                      error_status=args.error_status,
+                      drip_rate=args.drip_rate,
+                      drip_delay=args.drip_delay,
+                      drip_chunk=args.drip_chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    with make_server(args, args.port) as fake:
+        print(f"Serving search pages at {fake.search_url}")
+        try:
+            fake.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
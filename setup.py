@@ -30,6 +30,10 @@ setup(
     download_url = f'https://github.com/bobokvsky/yandex-images-download/archive/{__version__}.tar.gz',
     keywords='yandex images download save terminal command-line scrapper',
     install_requires=install_requires,
+    extras_require={
+        'async': ['aiohttp>=3.6'],
+        'images': ['Pillow>=6.0'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
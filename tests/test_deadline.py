@@ -0,0 +1,61 @@
+"""Deadlines of the sync engine against slow-drip images of fake_yandex.
+
+Usage: python -m unittest discover tests
+"""
+import pathlib
+import sys
+import tempfile
+import unittest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fake_yandex import FakeYandex
+from yandex_images_download.downloader import (DownloadOptions,
+                                               download_single_image)
+
+IMAGE_SIZE = 20000
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeYandex(latency=0,
+                               jitter=0,
+                               min_size=IMAGE_SIZE,
+                               max_size=IMAGE_SIZE,
+                               error_rate=0,
+                               drip_rate=1.0,
+                               drip_delay=0.3,
+                               drip_chunk=2048).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_directory = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.fake.close()
+        self.directory.cleanup()
+
+    def download(self, options):
+        return download_single_image(self.fake.image_url("deadline", 0, 0),
+                                     self.output_directory,
+                                     options=options)
+
+    def test_truncated_body_fails(self):
+        img_url_result = self.download(DownloadOptions(deadline=1.5))
+
+        self.assertEqual(img_url_result.status, "fail")
+        self.assertIn("Deadline", img_url_result.message)
+        self.assertIsNone(img_url_result.img_path)
+        self.assertEqual(list(self.output_directory.iterdir()), [])
+
+    def test_body_within_deadline_succeeds(self):
+        img_url_result = self.download(DownloadOptions(deadline=10))
+
+        self.assertEqual(img_url_result.status, "success")
+        self.assertEqual(
+            pathlib.Path(img_url_result.img_path).stat().st_size, IMAGE_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
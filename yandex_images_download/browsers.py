@@ -0,0 +1,100 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from .downloader import (Driver, YandexImagesDownloader, DownloaderResult,
+                         get_driver)
+
+
+class BrowserPool():
+    """Several WebDriver instances scraping keywords in parallel.
+
+    Each browser runs in its own thread with its own downloader and takes
+    the next keyword when it finishes one; image downloading engine,
+    journal and result sinks are shared.
+    """
+
+    def __init__(self,
+                 name: str,
+                 path: Optional[str],
+                 size=1,
+                 capture=True,
+                 profile="default"):
+        with ThreadPoolExecutor(size) as executor:
+            futures = [
+                executor.submit(get_driver, name, path, capture, profile)
+                for _ in range(size)
+            ]
+
+        self.drivers = []  # type: List[Driver]
+        errors = []
+        for future in futures:
+            try:
+                self.drivers.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            self.quit()
+            raise errors[0]
+
+    def quit(self):
+        for driver in self.drivers:
+            driver.quit()
+
+    def download_images(
+            self, keywords: Iterable[str],
+            make_downloader: Callable[[Driver], YandexImagesDownloader]
+    ) -> DownloaderResult:
+        """Spreads keywords over the browsers, results keep keywords order.
+
+        keywords are taken one at a time, as browsers become free.
+        """
+        if len(self.drivers) == 1:
+            return make_downloader(self.drivers[0]).download_images(keywords)
+
+        keywords_iterator = enumerate(keywords)
+        keywords_lock = threading.Lock()
+        stop = threading.Event()
+
+        def worker(driver):
+            taken = []
+
+            def take_keywords():
+                while not stop.is_set():
+                    with keywords_lock:
+                        i, keyword = next(keywords_iterator, (None, None))
+                    if i is None:
+                        return
+                    taken.append(i)
+                    yield keyword
+
+            try:
+                downloader_result = make_downloader(driver).download_images(
+                    take_keywords())
+            except BaseException:
+                stop.set()
+                raise
+
+            return list(zip(taken, downloader_result.keyword_results))
+
+        with ThreadPoolExecutor(len(self.drivers)) as executor:
+            futures = [
+                executor.submit(worker, driver) for driver in self.drivers
+            ]
+
+        keyword_results = []
+        for future in futures:
+            keyword_results.extend(future.result())
+        keyword_results.sort(key=lambda item: item[0])
+        logging.info(f"Keywords were scraped by {len(self.drivers)}"
+                     f" browsers.")
+
+        return DownloaderResult(
+            status="success",
+            message="Everything is downloaded!",
+            keyword_results=[
+                keyword_result for _, keyword_result in keyword_results
+            ])
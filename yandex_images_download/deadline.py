@@ -0,0 +1,83 @@
+import socket
+import threading
+import time
+
+from typing import Optional
+
+
+def response_socket(response) -> Optional[socket.socket]:
+    """Returns the socket a streamed requests response is read from.
+    """
+    raw = response.raw
+    connection = getattr(raw, "connection", None) or getattr(
+        raw, "_connection", None)
+
+    return getattr(connection, "sock", None)
+
+
+def abort_response(response):
+    """Interrupts a read of the response blocked in another thread.
+    """
+    sock = response_socket(response)
+    if sock is None:
+        return
+
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def set_read_timeout(response, seconds: float):
+    """Sets the timeout between bytes of the body, once headers are read.
+    """
+    sock = response_socket(response)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+class Deadline():
+    """Total time budget of one image, None seconds being no budget.
+
+    Timeouts of requests only bound the time between bytes, so watch()
+    aborts the response of a slow-drip host when the budget runs out.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds if seconds else None
+        self.expired = False
+
+    def remaining(self) -> Optional[float]:
+        if self.end is None:
+            return None
+
+        return max(self.end - time.monotonic(), 0.0)
+
+    def passed(self) -> bool:
+        return self.end is not None and time.monotonic() >= self.end
+
+    def budget(self, seconds: Optional[float] = None) -> Optional[float]:
+        """Returns seconds cut to the time remaining, never 0.
+        """
+        if self.end is None:
+            return seconds
+
+        remaining = max(self.remaining(), 0.001)
+        return remaining if seconds is None else min(seconds, remaining)
+
+    def watch(self, response) -> Optional[threading.Timer]:
+        """Aborts response when the deadline passes, returns the timer.
+        """
+        if self.end is None:
+            return None
+
+        def expire():
+            self.expired = True
+            abort_response(response)
+
+        timer = threading.Timer(self.remaining(), expire)
+        timer.daemon = True
+        timer.start()
+
+        return timer
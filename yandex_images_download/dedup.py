@@ -0,0 +1,111 @@
+import os
+import pathlib
+import sqlite3
+import threading
+
+from typing import Dict, Optional
+
+# One index per (process, path): sqlite connections must not cross a fork.
+_INDEXES = {}  # type: Dict[tuple, DedupIndex]
+_INDEXES_LOCK = threading.Lock()
+
+
+class DedupIndex():
+    """SQLite index of downloaded images by URL and by content hash.
+
+    It is shared by all workers and runs, so an image seen under another
+    keyword or in an earlier run is not downloaded or stored again.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        # Held from find_content() to add() of a new image, so equal images
+        # finishing at once in threads of the process aren't both new.
+        self.store_lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path,
+                                          timeout=60,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS urls ("
+                                " url TEXT PRIMARY KEY,"
+                                " sha256 TEXT,"
+                                " img_path TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS contents ("
+                                " sha256 TEXT PRIMARY KEY,"
+                                " img_path TEXT,"
+                                " phash TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS contents_phash"
+                                " ON contents (phash)")
+
+    def query_path(self, query, *params) -> Optional[str]:
+        """Returns the first img_path of query that still exists on disk.
+        """
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        for (img_path, ) in rows:
+            if img_path and os.path.exists(img_path):
+                return img_path
+
+        return None
+
+    def find_url(self, url) -> Optional[str]:
+        return self.query_path("SELECT img_path FROM urls WHERE url = ?", url)
+
+    def find_content(self, sha256, phash=None) -> Optional[str]:
+        img_path = self.query_path(
+            "SELECT img_path FROM contents WHERE sha256 = ?", sha256)
+        if img_path is None and phash is not None:
+            img_path = self.query_path(
+                "SELECT img_path FROM contents WHERE phash = ?", phash)
+
+        return img_path
+
+    def add(self, url, sha256, img_path, phash=None):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO urls VALUES (?, ?, ?)",
+                (url, sha256, str(img_path)))
+            self.connection.execute(
+                "INSERT OR IGNORE INTO contents VALUES (?, ?, ?)",
+                (sha256, str(img_path), phash))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def get_dedup_index(path) -> DedupIndex:
+    key = (os.getpid(), str(path))
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = DedupIndex(path)
+
+    return index
+
+
+def perceptual_hash(img_path: pathlib.Path) -> Optional[str]:
+    """Returns a 64-bit difference hash of the image, if Pillow is installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(img_path) as image:
+            image = image.convert("L").resize((9, 8), Image.LANCZOS)
+    except Exception:
+        return None
+
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+
+    return f"{bits:016x}"
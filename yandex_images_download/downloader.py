@@ -1,22 +1,45 @@
-import itertools
+import asyncio
+import hashlib
 import json
 import logging
+import mimetypes
 import os
 import pathlib
+import queue
 import re
 import requests
+import shutil
 import sys
+import threading
 import time
+import uuid
 
-from bs4 import BeautifulSoup
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from dataclasses_json import dataclass_json
-from math import floor
+from selenium import webdriver as selenium_webdriver
 from seleniumwire import webdriver
-from typing import List, Union, Optional
+from typing import (AsyncIterator, Dict, Iterable, Iterator, List,
+                    Sequence, Tuple, Union, Optional)
 from urllib.parse import urlparse, urlencode
 from urllib3.exceptions import SSLError, NewConnectionError
 
+from .deadline import Deadline, set_read_timeout
+from .dedup import get_dedup_index, perceptual_hash
+from .hedging import (Race, RaceLost, get_hedge_delay, get_latency_tracker,
+                      run_hedged)
+from .httpcache import HttpMeta, get_http_meta_store
+from .metrics import METRICS, StageTimer, observe_img_url_result
+from .planner import FailureStats, KeywordPlan
+from .profiles import (PROFILES, allow_images, get_profile,
+                       make_driver_args, setup_driver, wait_page_ready)
+from .ratelimit import THROTTLE_STATUS_CODES, RateLimiter, get_host_bucket
+from .serp import HttpSerpFetcher, SerpResponse
+from .serp_cache import SerpCache
+from .serp_parser import SerpItem, SerpPage, parse_serp
+from .session import get_session
+from .storage import get_layout
+
 Driver = Union[webdriver.Chrome, webdriver.Edge, 
                webdriver.Firefox, webdriver.Safari]
 
@@ -28,21 +51,129 @@ DRIVER_NAME_TO_CLASS = {
 }  # type: Dict[str, Driver]
 
 
-def get_driver(name: str, path: Optional[str]) -> Driver:
-    driver_class = DRIVER_NAME_TO_CLASS[name]
+# Requests selenium-wire keeps, the search page being the last one.
+CAPTURE_MAX_REQUESTS = 10
+
+
+def get_driver(name: str,
+               path: Optional[str],
+               capture=True,
+               profile="default") -> Driver:
+    """Starts the browser with one of PROFILES.
+
+    With capture, selenium-wire records only the search page requests, to
+    read their status. Without it the browser runs without the proxy.
+    """
+    browser_profile = PROFILES[profile]
     args = {'executable_path': path} if path else {}
+    args.update(make_driver_args(name, browser_profile))
+    if not capture:
+        driver = getattr(selenium_webdriver, name)(**args)
+    else:
+        args['seleniumwire_options'] = {
+            'request_storage': 'memory',
+            'request_storage_max_size': CAPTURE_MAX_REQUESTS,
+            'exclude_hosts': browser_profile.blocked_hosts
+        }
+        driver = DRIVER_NAME_TO_CLASS[name](**args)
+        driver.scopes = [f"^{re.escape(YandexImagesDownloader.MAIN_URL)}"]
+
+    setup_driver(driver, browser_profile)
 
-    return driver_class(**args)
+    return driver
 
 
 #####
+@dataclass
+class DownloadOptions:
+    """Settings of image downloading shared by all workers.
+    """
+    headers: Dict[str, str] = field(default_factory=dict)
+    cookies: Dict[str, str] = field(default_factory=dict)
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    retries: int = 3
+    backoff_factor: float = 0.3
+    # Seconds between bytes of a response.
+    timeout: float = 10
+    # Seconds to connect and to get response headers, timeout if None.
+    connect_timeout: Optional[float] = None
+    ttfb_timeout: Optional[float] = None
+    # Total seconds of an image, alternates and hedged requests included.
+    deadline: Optional[float] = None
+    # Percentile of recent image times after which a hedged request is sent.
+    hedge_percentile: Optional[float] = None
+    dedup_db: Optional[str] = None
+    dedup_mode: str = "hardlink"
+    dedup_phash: bool = False
+    host_rate: Optional[float] = None
+    stream: bool = False
+    max_bytes: Optional[int] = None
+    chunk_size: int = 64 * 1024
+    layout: str = "flat"
+    http_cache_db: Optional[str] = None
+    revalidate: str = "conditional"
+    # Sources tried after the image url fails, see SerpItem.alternate_urls.
+    alternates: int = 0
+    # Seconds to wait for response headers of a source with alternates left.
+    slow_ttfb: Optional[float] = None
+    prewarm: bool = False
+
+    def session_key(self):
+        return (tuple(sorted(self.headers.items())),
+                tuple(sorted(self.cookies.items())), self.pool_connections,
+                self.pool_maxsize, self.retries, self.backoff_factor)
+
+
 @dataclass_json
 @dataclass
 class ImgUrlResult:
     status: str
     message: str
     img_url: str
-    img_path: str
+    img_path: Optional[str]
+    # Seconds spent in each stage of the download, see StageTimer.
+    timings: Optional[Dict[str, float]] = None
+    # Filled by the postprocessing stage.
+    img_format: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    thumbnail_path: Optional[str] = None
+    # Alternate source the image was downloaded from, if not img_url.
+    source_url: Optional[str] = None
+    # A hedged request was sent for the image.
+    hedged: bool = False
+
+    def to_record(self) -> dict:
+        """Same as to_dict(), without dataclasses_json reflection.
+        """
+        return {
+            "status": self.status,
+            "message": self.message,
+            "img_url": self.img_url,
+            "img_path": self.img_path,
+            "timings": self.timings,
+            "img_format": self.img_format,
+            "width": self.width,
+            "height": self.height,
+            "thumbnail_path": self.thumbnail_path,
+            "source_url": self.source_url,
+            "hedged": self.hedged
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "ImgUrlResult":
+        return cls(status=record["status"],
+                   message=record["message"],
+                   img_url=record["img_url"],
+                   img_path=record["img_path"],
+                   timings=record.get("timings"),
+                   img_format=record.get("img_format"),
+                   width=record.get("width"),
+                   height=record.get("height"),
+                   thumbnail_path=record.get("thumbnail_path"),
+                   source_url=record.get("source_url"),
+                   hedged=record.get("hedged", False))
 
 
 @dataclass_json
@@ -54,6 +185,29 @@ class PageResult:
     errors_count: int
     img_url_results: List[ImgUrlResult]
 
+    def to_record(self) -> dict:
+        return {
+            "status": self.status,
+            "message": self.message,
+            "page": self.page,
+            "errors_count": self.errors_count,
+            "img_url_results": [
+                img_url_result.to_record()
+                for img_url_result in self.img_url_results
+            ]
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "PageResult":
+        return cls(status=record["status"],
+                   message=record["message"],
+                   page=record["page"],
+                   errors_count=record["errors_count"],
+                   img_url_results=[
+                       ImgUrlResult.from_record(img_url_record)
+                       for img_url_record in record["img_url_results"]
+                   ])
+
 
 @dataclass_json
 @dataclass
@@ -64,6 +218,28 @@ class KeywordResult:
     errors_count: int
     page_results: List[PageResult]
 
+    def to_record(self) -> dict:
+        return {
+            "status": self.status,
+            "message": self.message,
+            "keyword": self.keyword,
+            "errors_count": self.errors_count,
+            "page_results": [
+                page_result.to_record() for page_result in self.page_results
+            ]
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "KeywordResult":
+        return cls(status=record["status"],
+                   message=record["message"],
+                   keyword=record["keyword"],
+                   errors_count=record["errors_count"],
+                   page_results=[
+                       PageResult.from_record(page_record)
+                       for page_record in record["page_results"]
+                   ])
+
 
 @dataclass_json
 @dataclass
@@ -72,94 +248,499 @@ class DownloaderResult:
     message: str
     keyword_results: List[KeywordResult]
 
+    def to_record(self) -> dict:
+        return {
+            "status": self.status,
+            "message": self.message,
+            "keyword_results": [
+                keyword_result.to_record()
+                for keyword_result in self.keyword_results
+            ]
+        }
+
 
 def save_json(args, downloader_result: DownloaderResult):
-    downloader_result_json = downloader_result.to_dict()  # pylint: disable=no-member
     json_path = pathlib.Path(args.output_directory) / pathlib.Path(args.json)
-    pretty_json = json.dumps(downloader_result_json,
-                             indent=4,
-                             ensure_ascii=False)
-    with open(json_path, "w", encoding="utf-8") as f:
-        f.write(pretty_json)
+    write_json(json_path, downloader_result.to_record())
     logging.info(f"Result information saved: {json_path}.")
 
 
+def write_json(json_path, record: dict):
+    """Writes record to json_path without building the whole text first.
+    """
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=4, ensure_ascii=False)
+
+
 #####
 
 
-def filepath_fix_existing(directory_path: pathlib.Path, name: str,
-                          filepath: pathlib.Path) -> pathlib.Path:
-    """Expands name portion of filepath with numeric "(x)" suffix.
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".jpe", ".gif", ".png", ".bmp",
+                  ".svg", ".webp", ".ico", ".tif", ".tiff", ".avif")
+CONTENT_TYPE_TO_EXT = {
+    "image/gif": ".gif",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/svg+xml": ".svg",
+    "image/x-icon": ".ico",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tif",
+    "image/avif": ".avif"
+}
+# Types some hosts serve any file with, images included.
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+
+
+def get_img_extension(content_type: str) -> str:
+    """Returns the extension for content_type, "" if it is unknown or not
+    an image type.
     """
-    new_filepath = filepath
-    if filepath.exists():
-        for i in itertools.count(start=1):
-            new_name = f'{name} ({i}){filepath.suffix}'
-            new_filepath = directory_path / new_name
-            if not new_filepath.exists():
-                break
+    mime_type = content_type.split(";")[0].strip().lower()
+    if not mime_type.startswith("image/"):
+        return ""
 
-    return new_filepath
+    return (CONTENT_TYPE_TO_EXT.get(mime_type) or
+            mimetypes.guess_extension(mime_type) or "")
 
 
-def download_single_image(img_url: str,
-                          output_directory: pathlib.Path,
-                          sub_directory: str = "",
-                          multiproccess=False) -> ImgUrlResult:
-    img_url_result = ImgUrlResult(status=None,
-                                  message=None,
-                                  img_url=img_url,
-                                  img_path=None)
+def get_img_directory(output_directory: pathlib.Path,
+                      sub_directory: str = "") -> pathlib.Path:
+    directory_path = output_directory / sub_directory
+    directory_path.mkdir(parents=True, exist_ok=True)
 
-    img_extensions = (".jpg", ".jpeg", ".jfif", "jpe", ".gif", ".png", ".bmp",
-                      ".svg", ".webp", ".ico")
-    content_type_to_ext = {
-        "image/gif": ".gif",
-        "image/jpeg": ".jpg",
-        "image/png": ".png",
-        "image/svg+xml": ".svg",
-        "image/x-icon": ".ico"
-    }
+    return directory_path
 
-    try:
-        response = requests.get(img_url, timeout=10)
 
-        data = response.content
-        content_type = response.headers["Content-Type"]
+def get_img_path(img_url: str,
+                 content_type: str,
+                 directory_path: pathlib.Path,
+                 multiproccess=False,
+                 sha256: str = "",
+                 layout="flat") -> pathlib.Path:
+    """Chooses a free path for the image in directory_path.
+
+    layout is a name in storage.LAYOUTS, sha256 is the image content hash.
+    """
+    img_name = pathlib.Path(urlparse(img_url).path).name
+    img_name = img_name[:YandexImagesDownloader.MAXIMUM_FILENAME_LENGTH]
+
+    if multiproccess and layout == "flat":
+        img_name = f"[{os.getpid()}] {img_name}"
+
+    img_path = directory_path / img_name
+    extension = get_img_extension(content_type)
+    if extension and not any(
+            img_path.name.lower().endswith(ext) for ext in IMG_EXTENSIONS):
+        img_path = img_path.with_suffix(extension)
+
+    return get_layout(layout).allocate(directory_path, img_path, img_name,
+                                       sha256)
+
 
-        if response.ok:
+class ImageRejected(Exception):
+    pass
 
-            img_name = pathlib.Path(urlparse(img_url).path).name
-            img_name = img_name[:YandexImagesDownloader.MAXIMUM_FILENAME_LENGTH]
 
-            directory_path = output_directory / sub_directory
-            directory_path.mkdir(parents=True, exist_ok=True)
+class IncompleteBody(Exception):
+    pass
 
-            if multiproccess:
-                img_name = f"[{os.getpid()}] {img_name}"
 
-            img_path = directory_path / img_name
-            if not any(img_path.name.endswith(ext) for ext in img_extensions):
-                img_path = img_path.with_suffix(
-                    content_type_to_ext[content_type])
+def has_img_extension(img_url: str) -> bool:
+    return urlparse(img_url).path.lower().endswith(IMG_EXTENSIONS)
 
-            img_path = filepath_fix_existing(directory_path, img_name, img_path)
-            with open(img_path, "wb") as f:
-                f.write(data)
 
+def check_image_headers(headers, options: DownloadOptions, img_url=""):
+    """Rejects a response by its headers before reading the body.
+
+    A missing or generic Content-Type is accepted for an img_url with an
+    image extension.
+    """
+    content_type = headers.get("Content-Type", "")
+    mime_type = content_type.split(";")[0].strip().lower()
+    if not (mime_type.startswith("image/") or
+            mime_type in GENERIC_CONTENT_TYPES and has_img_extension(img_url)):
+        raise ImageRejected(f"Content-Type is not an image: {content_type}.")
+
+    content_length = headers.get("Content-Length")
+    if (options.max_bytes and content_length and
+            int(content_length) > options.max_bytes):
+        raise ImageRejected(f"Content-Length {content_length} exceeds"
+                            f" max_bytes {options.max_bytes}.")
+
+
+def check_body_complete(response, deadline: Deadline):
+    """Fails a body cut short by the deadline or a closed connection.
+
+    urllib3 doesn't check Content-Length, so a read aborted by
+    Deadline.watch() ends as if the whole body was received.
+    """
+    if deadline.expired:
+        raise IncompleteBody("The deadline aborted the body.")
+
+    content_length = response.headers.get("Content-Length", "")
+    if not content_length.isdigit():
+        return
+    # Bytes read off the wire, before any Content-Encoding is decoded.
+    received = response.raw.tell()
+    if received < int(content_length):
+        raise IncompleteBody(f"Body is incomplete: {received} of"
+                             f" {content_length} bytes received.")
+
+
+class PartFile:
+    """Temporary file in directory_path, renamed to its final path on commit.
+
+    The final path is chosen only after the body is written, so concurrent
+    downloads of the same name don't pick the same free path.
+    Nothing is left on disk if the byte cap is exceeded or writing fails.
+    write_time is the time spent writing to disk.
+    """
+
+    def __init__(self, directory_path: pathlib.Path,
+                 options: DownloadOptions):
+        self.options = options
+        self.tmp_path = directory_path / f".{uuid.uuid4().hex}.part"
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.done = False
+        self.write_time = 0.0
+        self.file = open(self.tmp_path, "xb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.options.max_bytes and self.size > self.options.max_bytes:
+            raise ImageRejected(f"Image exceeds max_bytes"
+                                f" {self.options.max_bytes}.")
+        start = time.perf_counter()
+        self.file.write(chunk)
+        self.write_time += time.perf_counter() - start
+        self.sha256.update(chunk)
+
+    def close(self):
+        self.file.close()
+
+    def commit(self, img_path: pathlib.Path):
+        self.file.close()
+        os.replace(self.tmp_path, img_path)
+        self.done = True
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+        self.done = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.done:
+            self.discard()
+
+
+def find_downloaded(img_url: str,
+                    options: DownloadOptions) -> Optional[ImgUrlResult]:
+    """Returns a result for img_url if the dedup index has it on disk.
+
+    A url known to the HTTP cache is revalidated instead, its image may
+    have changed since.
+    """
+    if not options.dedup_db or find_http_meta(img_url, options):
+        return None
+
+    img_path = get_dedup_index(options.dedup_db).find_url(img_url)
+    if img_path is None:
+        return None
+
+    return ImgUrlResult(status="duplicate",
+                        message="The image URL is already downloaded.",
+                        img_url=img_url,
+                        img_path=img_path)
+
+
+def find_http_meta(img_url: str,
+                   options: DownloadOptions) -> Optional[HttpMeta]:
+    """Returns validators of img_url if it was downloaded by an earlier run.
+    """
+    if not options.http_cache_db:
+        return None
+
+    return get_http_meta_store(options.http_cache_db).find(img_url)
+
+
+def set_cached(img_url_result: ImgUrlResult, http_meta: HttpMeta):
+    img_url_result.status = "cached"
+    img_url_result.message = "The image is not modified."
+    img_url_result.img_path = http_meta.img_path
+
+
+def remember_http_meta(img_url_result: ImgUrlResult, headers, size,
+                       options: DownloadOptions):
+    if options.http_cache_db and img_url_result.img_path:
+        get_http_meta_store(options.http_cache_db).put(
+            img_url_result.img_url, headers, size, img_url_result.img_path)
+
+
+def save_image(part: PartFile,
+               img_url_result: ImgUrlResult,
+               content_type: str,
+               directory_path: pathlib.Path,
+               options: DownloadOptions,
+               multiproccess=False,
+               http_meta: Optional[HttpMeta] = None):
+    """Moves the written part to a free path and fills img_url_result.
+
+    With the dedup index, content equal to an image already on disk is
+    hardlinked to it or only referenced instead. A modified image of
+    http_meta replaces its earlier version in the flat layout.
+    """
+    part.close()
+    sha256 = part.sha256.hexdigest()
+    if http_meta and options.layout == "flat" and not options.dedup_db:
+        img_path = pathlib.Path(http_meta.img_path)
+    else:
+        img_path = get_img_path(img_url_result.img_url, content_type,
+                                directory_path, multiproccess, sha256,
+                                options.layout)
+
+    if not options.dedup_db:
+        part.commit(img_path)
+        img_url_result.status = "success"
+        img_url_result.message = "Downloaded the image."
+        img_url_result.img_path = str(img_path)
+        return
+
+    index = get_dedup_index(options.dedup_db)
+    phash = perceptual_hash(part.tmp_path) if options.dedup_phash else None
+    with index.store_lock:
+        existing_path = index.find_content(sha256, phash)
+        if existing_path is None:
+            part.commit(img_path)
+            index.add(img_url_result.img_url, sha256, img_path, phash)
             img_url_result.status = "success"
             img_url_result.message = "Downloaded the image."
             img_url_result.img_path = str(img_path)
-        else:
-            img_url_result.status = "fail"
-            img_url_result.message = (f"img_url response is not ok."
-                                      f" response: {response}.")
+            return
+
+    part.discard()
+    if options.dedup_mode == "hardlink":
+        try:
+            os.link(existing_path, img_path)
+        except FileExistsError:
+            # The sharded layout gives equal content the same path.
+            pass
+        except OSError:
+            shutil.copyfile(existing_path, img_path)
+    else:
+        img_path = existing_path
+    index.add(img_url_result.img_url, sha256, img_path)
+
+    img_url_result.status = "duplicate"
+    img_url_result.message = f"Duplicate of {existing_path}."
+    img_url_result.img_path = str(img_path)
+
+
+def log_img_url_result(img_url_result: ImgUrlResult):
+    if img_url_result.status == "fail":
+        logging.info(f"    fail: {img_url_result.img_url}"
+                     f" error: {img_url_result.message}")
+    else:
+        logging.info(f"    {img_url_result.message}"
+                     f" ==> {img_url_result.img_path}")
+
+
+def pick_source_result(img_url: str,
+                       source_results: List[ImgUrlResult]) -> ImgUrlResult:
+    """Returns the result of the last source tried, as of img_url.
+
+    If every source failed, it is the failure of img_url itself.
+    """
+    img_url_result = source_results[-1]
+    if img_url_result.status == "fail":
+        img_url_result = source_results[0]
+        if len(source_results) > 1:
+            img_url_result.message = (f"{img_url_result.message}"
+                                      f" {len(source_results) - 1}"
+                                      f" alternates failed too.")
+    elif img_url_result.img_url != img_url:
+        img_url_result.source_url = img_url_result.img_url
+        img_url_result.img_url = img_url
+
+    return img_url_result
+
+
+def download_single_image(img_url: str,
+                          output_directory: pathlib.Path,
+                          sub_directory: str = "",
+                          multiproccess=False,
+                          options: Optional[DownloadOptions] = None,
+                          alternates: Sequence[str] = ()) -> ImgUrlResult:
+    """Downloads img_url, or the first of its alternates that works.
+
+    While alternates are left, a source gets no retries and at most
+    options.slow_ttfb seconds to respond. With options.hedge_percentile,
+    the first alternate, or img_url again, is requested as well once the
+    image takes longer than that percentile of recent images.
+    """
+    options = options or DownloadOptions()
+    start = time.perf_counter()
+    deadline = Deadline(options.deadline)
+    sources = [img_url, *alternates[:options.alternates]]
+    source_results = []
+
+    def download(i, race=None):
+        return download_source(sources[i], output_directory, sub_directory,
+                               multiproccess, options, i + 1 < len(sources),
+                               deadline, race)
+
+    next_source = 0
+    hedge_delay = get_hedge_delay(options)
+    if hedge_delay is not None:
+        hedge = 1 if len(sources) > 1 else 0
+        source_results.append(run_hedged(download, 0, hedge, hedge_delay))
+        next_source = hedge + 1 if source_results[-1].hedged else 1
+
+    for i in range(next_source, len(sources)):
+        if source_results and source_results[-1].status != "fail":
+            break
+        if deadline.passed():
+            break
+        source_results.append(download(i))
+
+    img_url_result = pick_source_result(img_url, source_results)
+    if img_url_result.status == "success":
+        get_latency_tracker().observe(time.perf_counter() - start)
+    log_img_url_result(img_url_result)
+
+    return img_url_result
+
+
+def download_source(img_url: str,
+                    output_directory: pathlib.Path,
+                    sub_directory: str,
+                    multiproccess: bool,
+                    options: DownloadOptions,
+                    alternates_left=False,
+                    deadline: Optional[Deadline] = None,
+                    race: Optional[Race] = None) -> ImgUrlResult:
+    img_url_result = ImgUrlResult(status=None,
+                                  message=None,
+                                  img_url=img_url,
+                                  img_path=None)
+
+    deadline = deadline or Deadline()
+    ttfb_timeout = options.ttfb_timeout or options.timeout
+    if alternates_left and options.slow_ttfb:
+        ttfb_timeout = min(ttfb_timeout, options.slow_ttfb)
+    timeout = (deadline.budget(options.connect_timeout or options.timeout),
+               deadline.budget(ttfb_timeout))
+    # Deadlines, the first byte timeout and races need the body streamed
+    # to be enforced while it is read.
+    stream = (options.stream or bool(options.max_bytes) or
+              ttfb_timeout != options.timeout or
+              deadline.end is not None or race is not None)
+
+    downloaded_result = find_downloaded(img_url, options)
+    if downloaded_result:
+        return downloaded_result
+
+    host_bucket = get_host_bucket(
+        options.host_rate,
+        urlparse(img_url).hostname) if options.host_rate else None
+    timer = StageTimer()
+    watcher = None
+
+    try:
+        if host_bucket:
+            host_bucket.acquire()
+        timer.lap("wait")
+
+        session = get_session(options, retries=not alternates_left)
+        http_meta = find_http_meta(img_url, options)
+        request_headers = None
+        if http_meta and options.revalidate == "head":
+            with session.head(img_url, timeout=timeout,
+                              allow_redirects=True) as head_response:
+                if head_response.ok and http_meta.matches(
+                        head_response.headers):
+                    set_cached(img_url_result, http_meta)
+                    img_url_result.timings = timer.finish()
+                    return img_url_result
+        elif http_meta:
+            request_headers = http_meta.request_headers()
+
+        response = session.get(img_url,
+                               headers=request_headers,
+                               timeout=timeout,
+                               stream=stream)
+        # Time to the response headers, connecting included.
+        ttfb = response.elapsed.total_seconds()
+        timer.add("ttfb", ttfb)
+
+        if host_bucket:
+            if response.status_code in THROTTLE_STATUS_CODES:
+                host_bucket.on_throttle()
+            else:
+                host_bucket.on_success()
+
+        if race:
+            race.start(img_url_result, response)
+        watcher = deadline.watch(response)
+        if stream:
+            set_read_timeout(response, options.timeout)
+
+        with response:
+            if response.status_code == 304 and http_meta:
+                set_cached(img_url_result, http_meta)
+            elif response.ok:
+                check_image_headers(response.headers, options, img_url)
+                content_type = response.headers.get("Content-Type", "")
+
+                directory_path = get_img_directory(output_directory,
+                                                   sub_directory)
+                with PartFile(directory_path, options) as part:
+                    if stream:
+                        for chunk in response.iter_content(
+                                chunk_size=options.chunk_size):
+                            if race and race.lost(img_url_result):
+                                raise RaceLost()
+                            part.write(chunk)
+                    else:
+                        part.write(response.content)
+                    check_body_complete(response, deadline)
+                    timer.add("write", part.write_time)
+                    timer.lap("body")
+                    timer.timings["body"] -= ttfb + part.write_time
+
+                    if race and not race.claim(img_url_result):
+                        raise RaceLost()
+                    save_image(part, img_url_result, content_type,
+                               directory_path, options, multiproccess,
+                               http_meta)
+                    remember_http_meta(img_url_result, response.headers,
+                                       part.size, options)
+                    timer.lap("write")
+            else:
+                img_url_result.status = "fail"
+                img_url_result.message = (f"img_url response is not ok."
+                                          f" response: {response}.")
 
     except (KeyboardInterrupt, SystemExit):
         raise
 
+    except ImageRejected as e:
+        img_url_result.status = "fail"
+        img_url_result.message = f"Image rejected. {e}"
+
+    except IncompleteBody as e:
+        img_url_result.status = "fail"
+        img_url_result.message = f"{e}"
+
     except (requests.exceptions.SSLError,
-            requests.exceptions.ConnectionError) as e:
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout) as e:
+        if host_bucket:
+            host_bucket.on_throttle()
         img_url_result.status = "fail"
         img_url_result.message = f"{type(e)}"
 
@@ -168,10 +749,15 @@ def download_single_image(img_url: str,
         img_url_result.message = (f"Something is wrong here.",
                                   f" Error: {type(exception), exception}")
 
+    if watcher:
+        watcher.cancel()
     if img_url_result.status == "fail":
-        logging.info(f"    fail: {img_url} error: {img_url_result.message}")
-    else:
-        logging.info(f"    {img_url_result.message} ==> {img_path}")
+        if race and race.lost(img_url_result):
+            img_url_result.message = "Another request of the image won."
+        elif deadline.expired or deadline.passed():
+            img_url_result.message = (f"Deadline of {options.deadline}"
+                                      f" seconds exceeded.")
+    img_url_result.timings = timer.finish()
 
     return img_url_result
 
@@ -187,6 +773,10 @@ class YandexImagesDownloader():
     MAXIMUM_PAGES_PER_SEARCH = 50
     MAXIMUM_IMAGES_PER_PAGE = 30
     MAXIMUM_FILENAME_LENGTH = 50
+    PROGRESS_INTERVAL = 10
+
+    # Only one captcha input() at a time when several browsers are used.
+    CAPTCHA_LOCK = threading.Lock()
 
     def __init__(self,
                  driver: Driver,
@@ -200,10 +790,26 @@ class YandexImagesDownloader():
                  itype=None,
                  commercial=None,
                  recent=None,
-                 pool=None):
+                 pool=None,
+                 download_options: Optional[DownloadOptions] = None,
+                 engine=None,
+                 pipeline=False,
+                 queue_size=100,
+                 serp_fetcher: Optional[HttpSerpFetcher] = None,
+                 journal=None,
+                 result_sink=None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 serp_cache: Optional[SerpCache] = None,
+                 limit_target="attempts",
+                 failure_stats: Optional[FailureStats] = None,
+                 postprocessor=None,
+                 work_queue=None):
         self.driver = driver
+        self.profile = get_profile(driver)
         self.output_directory = pathlib.Path(output_directory)
         self.limit = limit
+        self.limit_target = limit_target
+        self.failure_stats = failure_stats or FailureStats()
         self.isize = isize
         self.exact_isize = exact_isize
         self.iorient = iorient
@@ -221,14 +827,126 @@ class YandexImagesDownloader():
         }
         self.cookies = {}
         self.pool = pool
+        self.serp_fetcher = serp_fetcher
+        self.journal = journal
+        self.sinks = [
+            sink for sink in (journal, result_sink, work_queue) if sink
+        ]
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.serp_cache = serp_cache
+        self.postprocessor = postprocessor
+
+        if engine is None:
+            from .engine import SyncEngine, PoolEngine
+            engine = PoolEngine(pool=pool) if pool else SyncEngine()
+        self.engine = engine
+
+        # In pipeline mode page results are collected after all keywords,
+        # and queue_size bounds the images submitted but not downloaded yet.
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.in_flight = threading.BoundedSemaphore(
+            queue_size) if pipeline else None
+
+        self.download_options = download_options or DownloadOptions()
+        self.download_options.headers = {
+            **self.requests_headers,
+            **self.download_options.headers
+        }
+        self.download_options.cookies = {
+            **self.cookies,
+            **self.download_options.cookies
+        }
 
         logging.info(f'Output directory is set to "{self.output_directory}/"')
         logging.info(f"Limit of images is set to {self.limit}")
 
     def get_response(self):
-        pathes = [request.path for request in self.driver.requests]
-        request = self.driver.requests[pathes.index(self.driver.current_url)]
-        return request.response
+        """Returns the captured response of the current page, if any.
+
+        Capture is scoped to MAIN_URL, so the page is one of the last
+        requests.
+        """
+        captured = getattr(self.driver, "requests", None)
+        if not captured:
+            return None
+
+        current_url = self.driver.current_url
+        for request in reversed(captured):
+            if request.url == current_url:
+                return request.response
+
+        return captured[-1].response
+
+    def clear_requests(self):
+        if hasattr(self.driver, "requests"):
+            del self.driver.requests
+
+    def get_page(self, params) -> SerpResponse:
+        """Returns MAIN_URL page with params from serp_cache or loads it.
+        """
+        if self.serp_cache:
+            serp_page = self.serp_cache.get(params)
+            if serp_page:
+                METRICS.inc("serp_pages_total", source="cache")
+                return SerpResponse(ok=True, status_code=200, page=serp_page)
+
+        response = self.load_page(params)
+
+        if self.serp_cache and response.ok:
+            self.serp_cache.put(params, response.page)
+
+        return response
+
+    def load_page(self, params) -> SerpResponse:
+        """Loads MAIN_URL with params, through serp_fetcher if it is set.
+
+        The browser is used only when serp_fetcher gets a captcha.
+        """
+        serp_bucket = self.rate_limiter.serp
+        with METRICS.time("serp_seconds", stage="wait"):
+            serp_bucket.acquire()
+
+        if self.serp_fetcher:
+            try:
+                serp_response = self.serp_fetcher.fetch(
+                    YandexImagesDownloader.MAIN_URL, params=params)
+            except requests.exceptions.ConnectionError:
+                serp_bucket.on_throttle()
+                raise
+
+            if serp_response:
+                METRICS.inc("serp_pages_total", source="http")
+                if serp_response.status_code in THROTTLE_STATUS_CODES:
+                    serp_bucket.on_throttle()
+                else:
+                    serp_bucket.on_success()
+                return serp_response
+
+            serp_bucket.on_throttle()
+            if self.driver is None:
+                logging.warning("Got captcha and there is no browser"
+                                " to type it.")
+                raise YandexImagesDownloader.StopCaptchaInput()
+
+        serp_page = self.check_captcha_and_get(
+            YandexImagesDownloader.MAIN_URL, params=params)
+        response = self.get_response()
+        METRICS.inc("serp_pages_total", source="browser")
+
+        # Without capture, a page that parsed without captcha is taken as ok.
+        status_code = response.status_code if response else 200
+        if status_code in THROTTLE_STATUS_CODES:
+            serp_bucket.on_throttle()
+        else:
+            serp_bucket.on_success()
+
+        if self.serp_fetcher:
+            self.serp_fetcher.update_from_driver(self.driver)
+
+        return SerpResponse(ok=response.reason == "OK" if response else True,
+                            status_code=status_code,
+                            page=serp_page)
 
     def init_url_params(self):
         params = {
@@ -258,8 +976,18 @@ class YandexImagesDownloader():
 
         return params
 
-    def download_images_by_page(self, keyword, page, imgs_count,
-                                sub_directory) -> PageResult:
+    def download_images_by_page(self,
+                                keyword,
+                                page,
+                                max_images,
+                                sub_directory,
+                                response: Optional[SerpResponse] = None,
+                                plan: Optional[KeywordPlan] = None
+                               ) -> PageResult:
+        """Submits at most max_images images of the page.
+
+        response is the page if it is already loaded.
+        """
 
         page_result = PageResult(status=None,
                                  message=None,
@@ -267,12 +995,10 @@ class YandexImagesDownloader():
                                  errors_count=None,
                                  img_url_results=[])
 
-        self.check_captcha_and_get(YandexImagesDownloader.MAIN_URL,
-                                   params=self.get_url_params(page, keyword))
+        if response is None:
+            response = self.get_page(self.get_url_params(page, keyword))
 
-        response = self.get_response()
-
-        if not (response.reason == "OK"):
+        if not response.ok:
             page_result.status = "fail"
             page_result.message = (f"Page response is not ok."
                                    f" page: {page},",
@@ -280,45 +1006,103 @@ class YandexImagesDownloader():
             page_result.errors_count = YandexImagesDownloader.MAXIMUM_IMAGES_PER_PAGE
             return page_result
 
-        soup_page = BeautifulSoup(self.driver.page_source, "lxml")
-
-        # Getting all image urls from page.
-        tag_sepr_item = soup_page.find_all("div", class_="serp-item")
-        serp_items = [
-            json.loads(item.attrs["data-bem"])["serp-item"]
-            for item in tag_sepr_item
-        ]
-        img_hrefs = [key["img_href"] for key in serp_items]
-
-        errors_count = 0
-        for img_url in img_hrefs:
-            if imgs_count >= self.limit:
-                break
-
-            if self.pool:
-                img_url_result = self.pool.apply_async(
-                    download_single_image,
-                    args=(img_url, self.output_directory, sub_directory, True))
-            else:
-                img_url_result = download_single_image(img_url,
-                                                       self.output_directory,
-                                                       sub_directory)
+        serp_items = response.page.items[:max_images]
+        self.prewarm(serp_items)
 
+        for serp_item in serp_items:
+            img_url_result = self.submit_download(
+                serp_item.img_href, keyword, page,
+                len(page_result.img_url_results), sub_directory,
+                self.get_alternates(serp_item))
+            if plan:
+                plan.track(img_url_result)
             page_result.img_url_results.append(img_url_result)
 
-            imgs_count += 1
+        if not self.pipeline:
+            self.finish_page(page_result, keyword)
+
+        return page_result
 
-        if self.pool:
-            for i, img_url_result in enumerate(page_result.img_url_results):
-                page_result.img_url_results[i] = img_url_result.get()
-        errors_count += sum(1 if page_result.status == "fail" else 0
-                            for page_result in page_result.img_url_results)
+    def get_alternates(self, serp_item: SerpItem) -> List[str]:
+        if not self.download_options.alternates:
+            return []
+
+        return serp_item.alternate_urls()[:self.download_options.alternates]
+
+    def prewarm(self, serp_items: List[SerpItem]):
+        """Has the engine prewarm hosts of a page's images before they start.
+        """
+        if self.download_options.prewarm:
+            self.engine.prewarm(
+                [serp_item.img_href for serp_item in serp_items],
+                self.download_options)
+
+    def submit_download(self,
+                        img_url,
+                        keyword,
+                        page,
+                        index,
+                        sub_directory,
+                        alternates: Sequence[str] = ()) -> Future:
+        if self.journal:
+            img_url_result = self.journal.find_image(keyword, img_url)
+            if img_url_result:
+                future = Future()
+                future.set_result(img_url_result)
+                return future
+
+        if self.in_flight:
+            self.in_flight.acquire()
+
+        future = self.engine.submit(img_url,
+                                    self.output_directory,
+                                    sub_directory,
+                                    self.download_options,
+                                    alternates=alternates)
+        if self.postprocessor:
+            future = self.postprocessor.submit(future)
+
+        if self.in_flight:
+            future.add_done_callback(lambda _: self.in_flight.release())
+        future.add_done_callback(
+            lambda future: observe_img_url_result(future.result()))
+        for sink in self.sinks:
+            future.add_done_callback(
+                lambda future, sink=sink: sink.image_done(
+                    keyword, page, index, future.result()))
+
+        return future
+
+    def finish_page(self, page_result: PageResult, keyword):
+        """Waits for the downloads of the page and counts errors.
+        """
+        for i, img_url_result in enumerate(page_result.img_url_results):
+            page_result.img_url_results[i] = img_url_result.result()
+        errors_count = sum(1 if img_url_result.status == "fail" else 0
+                           for img_url_result in page_result.img_url_results)
 
         page_result.status = "success"
-        page_result.message = f"All successful images from page {page} downloaded."
+        page_result.message = (f"All successful images from page"
+                               f" {page_result.page} downloaded.")
         page_result.errors_count = errors_count
 
-        return page_result
+        for sink in self.sinks:
+            sink.page_done(keyword, page_result)
+
+    def finish_keyword(self, keyword_result: KeywordResult):
+        for page_result in keyword_result.page_results:
+            if page_result.status is None:
+                self.finish_page(page_result, keyword_result.keyword)
+
+        keyword_result.status = "success"
+        keyword_result.message = (f"All images for {keyword_result.keyword}"
+                                  f" downloaded!")
+        keyword_result.errors_count = sum(
+            page_result.errors_count
+            for page_result in keyword_result.page_results)
+
+        for sink in self.sinks:
+            sink.keyword_done(keyword_result)
 
     def download_images_by_keyword(self, keyword,
                                    sub_directory="") -> KeywordResult:
@@ -328,69 +1112,78 @@ class YandexImagesDownloader():
                                        errors_count=None,
                                        page_results=[])
 
-        self.check_captcha_and_get(YandexImagesDownloader.MAIN_URL,
-                                   params={
-                                       'text': keyword,
-                                       "nomisspell": 1
-                                   })
-        response = self.get_response()
+        # The first page gives the number of pages and is scraped as is.
+        response = self.get_page(self.get_url_params(0, keyword))
 
-        if not (response.reason == "OK"):
-            keyword_result = "fail"
+        if not response.ok:
+            keyword_result.status = "fail"
             keyword_result.message = (
                 "Failed to fetch a search page."
                 f" url: {YandexImagesDownloader.MAIN_URL},"
                 f" params: {{'text': {keyword}}},"
                 f" status_code: {response.status_code}")
+            for sink in self.sinks:
+                sink.keyword_done(keyword_result)
             return keyword_result
 
-        soup = BeautifulSoup(self.driver.page_source, "lxml")
-
         # Getting last_page.
-        tag_serp_list = soup.find("div", class_="serp-list")
-        if not tag_serp_list:
+        last_page = response.page.last_page
+        if last_page is None:
             keyword_result.status = "success"
             keyword_result.message = f"No images with keyword {keyword} found."
             keyword_result.errors_count = 0
             logging.info(f"    {keyword_result.message}")
+            for sink in self.sinks:
+                sink.keyword_done(keyword_result)
             return keyword_result
-        serp_list = json.loads(tag_serp_list.attrs["data-bem"])["serp-list"]
-        last_page = serp_list["lastPage"]
-        actual_last_page = 1 + floor(
-            self.limit / YandexImagesDownloader.MAXIMUM_IMAGES_PER_PAGE)
 
         logging.info(f"  Found {last_page+1} pages of {keyword}.")
 
-        # Getting all images.
-        imgs_count = 0
-        errors_count = 0
-
-        for page in range(last_page + 1):
-            if imgs_count >= self.limit:
-                break
-
-            if page > actual_last_page:
-                actual_last_page += 1
-
-            logging.info(f"  Scrapping page {page+1}/{actual_last_page}...")
-
-            page_result = self.download_images_by_page(keyword, page,
-                                                       imgs_count,
-                                                       sub_directory)
+        # Getting images until the limit is reached, waiting for images in
+        # flight when only their failures could require another page.
+        plan = KeywordPlan(self.limit, self.limit_target, self.failure_stats,
+                           len(response.page.img_hrefs) or
+                           YandexImagesDownloader.MAXIMUM_IMAGES_PER_PAGE)
+        page = 0
+
+        while page <= last_page:
+            max_images = plan.urls_to_take()
+            if max_images <= 0:
+                if plan.target != "successes" or not plan.has_pending():
+                    break
+                plan.wait()
+                continue
+
+            page_result = self.journal.find_page(
+                keyword, page) if self.journal else None
+            if page_result:
+                logging.info(f"  Page {page+1} is already done.")
+                keyword_result.page_results.append(page_result)
+                plan.add_results(page_result.img_url_results)
+                page += 1
+                continue
+
+            logging.info(f"  Scrapping page {page+1}/"
+                         f"{min(last_page + 1, plan.pages_needed(page))}...")
+
+            page_result = self.download_images_by_page(
+                keyword,
+                page,
+                max_images,
+                sub_directory,
+                response=response if page == 0 else None,
+                plan=plan)
             keyword_result.page_results.append(page_result)
+            page += 1
 
-            imgs_count += len(page_result.img_url_results)
-            errors_count += page_result.errors_count
-
-            time.sleep(0.5)  # bot id protection
-
-        keyword_result.status = "success"
-        keyword_result.message = f"All images for {keyword} downloaded!"
-        keyword_result.errors_count = errors_count
+        if self.pipeline:
+            keyword_result.message = f"All images for {keyword} queued."
+        else:
+            self.finish_keyword(keyword_result)
 
         return keyword_result
 
-    def download_images(self, keywords: List[str]) -> DownloaderResult:
+    def download_images(self, keywords: Iterable[str]) -> DownloaderResult:
         dowloader_result = DownloaderResult(status=None,
                                             message=None,
                                             keyword_results=[])
@@ -398,6 +1191,16 @@ class YandexImagesDownloader():
         dowloader_result.status = "fail"
 
         for keyword in keywords:
+            keyword_result = self.journal.find_keyword(
+                keyword) if self.journal else None
+            if keyword_result:
+                logging.info(f"Images for {keyword} are already downloaded.")
+                dowloader_result.keyword_results.append(keyword_result)
+                for sink in self.sinks:
+                    if sink is not self.journal:
+                        sink.keyword_done(keyword_result)
+                continue
+
             logging.info(f"Downloading images for {keyword}...")
 
             keyword_result = self.download_images_by_keyword(
@@ -406,34 +1209,237 @@ class YandexImagesDownloader():
 
             logging.info(keyword_result.message)
 
+        if self.pipeline:
+            logging.info("Waiting for queued images...")
+            for keyword_result in dowloader_result.keyword_results:
+                if keyword_result.status is None:
+                    self.finish_keyword(keyword_result)
+                    logging.info(keyword_result.message)
+
         dowloader_result.status = "success"
         dowloader_result.message = "Everything is downloaded!"
 
         return dowloader_result
 
+    def iter_images(self,
+                    keywords: Iterable[str],
+                    urls_only=False) -> Iterator[Tuple[str, ImgUrlResult]]:
+        """Yields (keyword, img_url_result) as soon as each image is done.
+
+        At most queue_size images are in flight, and no page is loaded or
+        image submitted while the consumer is behind. Results are not kept
+        after they are yielded. With urls_only nothing is downloaded and
+        results have status "url".
+        """
+        done = queue.Queue()
+        in_flight = 0
+
+        def next_done():
+            nonlocal in_flight
+            keyword, future = done.get()
+            in_flight -= 1
+            return keyword, future.result()
+
+        for keyword in keywords:
+            logging.info(f"Listing images for {keyword}...")
+            response = self.get_page(self.get_url_params(0, keyword))
+            if not response.ok or response.page.last_page is None:
+                logging.info(f"  No images with keyword {keyword} found.")
+                continue
+
+            plan = KeywordPlan(self.limit, self.limit_target,
+                               self.failure_stats,
+                               len(response.page.img_hrefs) or
+                               YandexImagesDownloader.MAXIMUM_IMAGES_PER_PAGE)
+            page = 0
+
+            while page <= response.page.last_page:
+                max_images = plan.urls_to_take()
+                if max_images <= 0:
+                    if not plan.has_pending():
+                        break
+                    yield next_done()
+                    continue
+
+                if page:
+                    response = self.get_page(
+                        self.get_url_params(page, keyword))
+                    if not response.ok:
+                        page += 1
+                        continue
+
+                serp_items = response.page.items[:max_images]
+                if not urls_only:
+                    self.prewarm(serp_items)
+
+                for index, serp_item in enumerate(serp_items):
+                    while in_flight >= self.queue_size:
+                        yield next_done()
+
+                    if urls_only:
+                        future = Future()
+                        future.set_result(
+                            ImgUrlResult(status="url",
+                                         message="Not downloaded.",
+                                         img_url=serp_item.img_href,
+                                         img_path=None))
+                    else:
+                        future = self.submit_download(
+                            serp_item.img_href, keyword, page, index,
+                            keyword, self.get_alternates(serp_item))
+                    plan.track(future)
+                    future.add_done_callback(
+                        lambda future, keyword=keyword: done.put(
+                            (keyword, future)))
+                    in_flight += 1
+
+                page += 1
+
+        while in_flight:
+            yield next_done()
+
+    async def aiter_images(
+            self,
+            keywords: Iterable[str],
+            urls_only=False) -> AsyncIterator[Tuple[str, ImgUrlResult]]:
+        """iter_images for asyncio, run in a thread of its own.
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(1)
+        iterator = self.iter_images(keywords, urls_only)
+        end = object()
+
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, iterator,
+                                                  end)
+                if item is end:
+                    return
+                yield item
+        finally:
+            await loop.run_in_executor(executor, iterator.close)
+            executor.shutdown()
+
+    def iter_urls(self,
+                  img_urls: Iterable[str],
+                  sub_directory="") -> Iterator[Tuple[int, ImgUrlResult]]:
+        """Yields (index, img_url_result) as soon as each image is done.
+
+        No search page is loaded, so the downloader needs no driver. At
+        most queue_size images are in flight. Sinks get images as of
+        keyword sub_directory, page 0. Progress is logged every
+        PROGRESS_INTERVAL seconds.
+        """
+        total = len(img_urls) if hasattr(img_urls, "__len__") else None
+        done = queue.Queue()
+        in_flight = 0
+        finished = 0
+        errors_count = 0
+        logged_time = time.time()
+
+        def next_done():
+            nonlocal in_flight, finished, errors_count, logged_time
+            index, future = done.get()
+            img_url_result = future.result()
+            in_flight -= 1
+            finished += 1
+            errors_count += 1 if img_url_result.status == "fail" else 0
+
+            if (time.time() - logged_time >=
+                    YandexImagesDownloader.PROGRESS_INTERVAL or
+                    finished == total):
+                logged_time = time.time()
+                logging.info(f"  Downloaded {finished}"
+                             f"{f'/{total}' if total is not None else ''}"
+                             f" images, {errors_count} errors.")
+
+            return index, img_url_result
+
+        for index, img_url in enumerate(img_urls):
+            while in_flight >= self.queue_size:
+                yield next_done()
+
+            future = self.submit_download(img_url, sub_directory, 0, index,
+                                          sub_directory)
+            future.add_done_callback(
+                lambda future, index=index: done.put((index, future)))
+            in_flight += 1
+
+        while in_flight:
+            yield next_done()
+
+    def download_urls(self, img_urls: Iterable[str],
+                      sub_directory="") -> PageResult:
+        """Downloads images by url with the engine, see iter_urls().
+
+        Results keep the order of img_urls.
+        """
+        results_by_index = dict(self.iter_urls(img_urls, sub_directory))
+        img_url_results = [
+            results_by_index[index] for index in range(len(results_by_index))
+        ]
+
+        return PageResult(status="success",
+                          message="All images downloaded.",
+                          page=0,
+                          errors_count=sum(
+                              1 if img_url_result.status == "fail" else 0
+                              for img_url_result in img_url_results),
+                          img_url_results=img_url_results)
+
     class StopCaptchaInput(Exception):
         pass
 
-    def check_captcha_and_get(self, url, params=None):
+    def show_captcha(self):
+        """Reloads the captcha with images if the profile blocks them.
+        """
+        if not self.profile.block_images:
+            return
+
+        if allow_images(self.driver, self.profile):
+            self.driver.refresh()
+            wait_page_ready(self.driver, self.profile)
+        else:
+            logging.warning("Images are blocked by the browser profile,"
+                            " the captcha picture may be missing.")
+
+    def check_captcha_and_get(self, url, params=None) -> SerpPage:
         """Checking for captcha on url and get url after that.
-        If there is captcha, you have to type it in input() or quit."""
+        If there is captcha, you have to type it in input() or quit.
+        Returns the parsed page."""
 
         url_with_params = f"{url}?{urlencode(params)}"
 
-        del self.driver.requests
-        self.driver.get(url_with_params)
+        self.clear_requests()
+        with METRICS.time("serp_seconds", stage="browser"):
+            self.driver.get(url_with_params)
+            wait_page_ready(self.driver, self.profile)
 
         while True:
-            soup = BeautifulSoup(self.driver.page_source, "lxml")
+            with METRICS.time("serp_seconds", stage="parse"):
+                serp_page = parse_serp(self.driver.page_source)
+            if not serp_page.captcha:
+                return serp_page
+
+            METRICS.inc("captchas_total")
+            self.rate_limiter.serp.on_throttle()
 
-            if not soup.select(".form__captcha"):
-                break
+            if self.profile.headless:
+                logging.warning("Got captcha in a headless browser, run"
+                                " with a visible browser profile to type it.")
+                raise YandexImagesDownloader.StopCaptchaInput()
 
-            logging.warning(f"Please, type the captcha in the browser,"
-                            " then press Enter or type [q] to exit")
-            reply = input()
+            with YandexImagesDownloader.CAPTCHA_LOCK, METRICS.time(
+                    "serp_seconds", stage="captcha"):
+                self.show_captcha()
+                logging.warning(f"Please, type the captcha in the browser,"
+                                " then press Enter or type [q] to exit")
+                reply = input()
             if reply == "q":
                 raise YandexImagesDownloader.StopCaptchaInput()
 
-            del self.driver.requests
-            self.driver.get(url_with_params)
+            setup_driver(self.driver, self.profile)
+            self.clear_requests()
+            with METRICS.time("serp_seconds", stage="browser"):
+                self.driver.get(url_with_params)
+                wait_page_ready(self.driver, self.profile)
@@ -0,0 +1,414 @@
+import asyncio
+import pathlib
+import threading
+import time
+
+from concurrent.futures import Future
+from multiprocessing import Pool
+from urllib.parse import urlparse
+
+from typing import Optional, Sequence
+
+from .deadline import Deadline
+from .downloader import (DownloadOptions, ImgUrlResult, ImageRejected,
+                         PartFile, check_image_headers, download_single_image,
+                         find_downloaded, find_http_meta, get_img_directory,
+                         log_img_url_result, pick_source_result,
+                         remember_http_meta, save_image, set_cached)
+from .hedging import (Race, RaceLost, get_hedge_delay, get_latency_tracker,
+                      run_hedged_async)
+from .metrics import StageTimer
+from .ratelimit import THROTTLE_STATUS_CODES, get_host_bucket
+from .session import RETRY_STATUS_CODES, Prewarmer, resolve_host
+
+ENGINE_NAMES = ["pool", "async"]
+
+
+class SyncEngine():
+    """Downloads images one by one in the calling thread.
+
+    prewarm() opens connections to the hosts of the next images in
+    background threads, while the current one is downloading.
+    """
+
+    def __init__(self):
+        self.prewarmer = Prewarmer()
+
+    def submit(self,
+               img_url: str,
+               output_directory: pathlib.Path,
+               sub_directory: str,
+               options: DownloadOptions,
+               alternates: Sequence[str] = ()) -> Future:
+        future = Future()
+        future.set_result(
+            download_single_image(img_url,
+                                  output_directory,
+                                  sub_directory,
+                                  options=options,
+                                  alternates=alternates))
+        return future
+
+    def prewarm(self, img_urls, options: DownloadOptions):
+        self.prewarmer.prewarm(img_urls, options)
+
+    def close(self):
+        self.prewarmer.close()
+
+
+class PoolEngine():
+    """Downloads images in a multiprocessing.Pool of worker processes.
+
+    Connections belong to the workers, so prewarm() only resolves hosts,
+    which helps if the system caches DNS.
+    """
+
+    def __init__(self, num_workers=None, pool=None):
+        self.owns_pool = pool is None
+        self.pool = pool or Pool(num_workers)
+        self.prewarmer = Prewarmer(resolve_host)
+
+    def submit(self,
+               img_url: str,
+               output_directory: pathlib.Path,
+               sub_directory: str,
+               options: DownloadOptions,
+               alternates: Sequence[str] = ()) -> Future:
+        future = Future()
+        self.pool.apply_async(download_single_image,
+                              args=(img_url, output_directory, sub_directory,
+                                    True, options, alternates),
+                              callback=future.set_result,
+                              error_callback=future.set_exception)
+        return future
+
+    def prewarm(self, img_urls, options: DownloadOptions):
+        self.prewarmer.prewarm(img_urls, options)
+
+    def close(self):
+        self.prewarmer.close()
+        if self.owns_pool:
+            self.pool.close()
+            self.pool.join()
+
+
+class AsyncEngine():
+    """Downloads images with aiohttp on an event loop in a background thread.
+
+    concurrency bounds the number of images in flight in the process,
+    DownloadOptions.pool_maxsize bounds connections per host.
+    Timings have "dns" and "connect" in addition, both part of "ttfb".
+    prewarm() only resolves hosts, which helps if the system caches DNS.
+    """
+
+    def __init__(self, concurrency=100):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("AsyncEngine requires aiohttp:"
+                              " pip install aiohttp") from None
+        self.aiohttp = aiohttp
+        self.concurrency = concurrency
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+
+        self.semaphore = None
+        self.sessions = {}
+        self.prewarmer = Prewarmer(resolve_host)
+
+    def submit(self,
+               img_url: str,
+               output_directory: pathlib.Path,
+               sub_directory: str,
+               options: DownloadOptions,
+               alternates: Sequence[str] = ()) -> Future:
+        return asyncio.run_coroutine_threadsafe(
+            self.download(img_url, output_directory, sub_directory, options,
+                          alternates), self.loop)
+
+    def prewarm(self, img_urls, options: DownloadOptions):
+        self.prewarmer.prewarm(img_urls, options)
+
+    def close(self):
+        self.prewarmer.close()
+        asyncio.run_coroutine_threadsafe(self.close_sessions(),
+                                         self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def close_sessions(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    def get_session(self, options: DownloadOptions):
+        key = options.session_key()
+        session = self.sessions.get(key)
+        if session is None:
+            connector = self.aiohttp.TCPConnector(
+                limit=self.concurrency, limit_per_host=options.pool_maxsize)
+            timeout = self.get_timeout(options)
+            session = self.aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers=options.headers,
+                cookies=options.cookies,
+                trace_configs=[self.make_trace_config()])
+            self.sessions[key] = session
+
+        return session
+
+    def get_timeout(self,
+                    options: DownloadOptions,
+                    deadline: Optional[Deadline] = None):
+        return self.aiohttp.ClientTimeout(
+            total=deadline.budget() if deadline else None,
+            sock_connect=options.connect_timeout or options.timeout,
+            sock_read=options.timeout)
+
+    def make_trace_config(self):
+        """Adds dns and connect time to the StageTimer of the request.
+        """
+        async def on_start(session, context, params):
+            context.start = time.perf_counter()
+
+        def on_end(stage):
+            async def on_end(session, context, params):
+                if context.trace_request_ctx:
+                    context.trace_request_ctx.add(
+                        stage,
+                        time.perf_counter() - context.start)
+
+            return on_end
+
+        trace_config = self.aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(on_start)
+        trace_config.on_dns_resolvehost_end.append(on_end("dns"))
+        trace_config.on_connection_create_start.append(on_start)
+        trace_config.on_connection_create_end.append(on_end("connect"))
+
+        return trace_config
+
+    async def download(self,
+                       img_url: str,
+                       output_directory: pathlib.Path,
+                       sub_directory: str,
+                       options: DownloadOptions,
+                       alternates: Sequence[str] = ()) -> ImgUrlResult:
+        """Downloads img_url or an alternate, as download_single_image().
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        start = time.perf_counter()
+        deadline = Deadline(options.deadline)
+        sources = [img_url, *alternates[:options.alternates]]
+        source_results = []
+
+        async def download(i, race=None):
+            downloaded_result = find_downloaded(sources[i], options)
+            if downloaded_result:
+                return downloaded_result
+
+            return await self.download_with_retries(sources[i],
+                                                    output_directory,
+                                                    sub_directory, options,
+                                                    i + 1 < len(sources),
+                                                    deadline, race)
+
+        async with self.semaphore:
+            next_source = 0
+            hedge_delay = get_hedge_delay(options)
+            if hedge_delay is not None:
+                hedge = 1 if len(sources) > 1 else 0
+                source_results.append(await run_hedged_async(
+                    download, 0, hedge, hedge_delay))
+                next_source = hedge + 1 if source_results[-1].hedged else 1
+
+            for i in range(next_source, len(sources)):
+                if source_results and source_results[-1].status != "fail":
+                    break
+                if deadline.passed():
+                    break
+                source_results.append(await download(i))
+
+        img_url_result = pick_source_result(img_url, source_results)
+        if img_url_result.status == "success":
+            get_latency_tracker().observe(time.perf_counter() - start)
+        log_img_url_result(img_url_result)
+
+        return img_url_result
+
+    async def download_with_retries(self,
+                                    img_url: str,
+                                    output_directory: pathlib.Path,
+                                    sub_directory: str,
+                                    options: DownloadOptions,
+                                    alternates_left=False,
+                                    deadline: Optional[Deadline] = None,
+                                    race: Optional[Race] = None
+                                   ) -> ImgUrlResult:
+        host_bucket = get_host_bucket(
+            options.host_rate,
+            urlparse(img_url).hostname) if options.host_rate else None
+        timer = StageTimer()
+        deadline = deadline or Deadline()
+        retries = 0 if alternates_left else options.retries
+        ttfb_timeout = options.ttfb_timeout
+        if alternates_left and options.slow_ttfb:
+            ttfb_timeout = min(ttfb_timeout or options.slow_ttfb,
+                               options.slow_ttfb)
+
+        for attempt in range(retries + 1):
+            if attempt:
+                if deadline.passed():
+                    break
+                await asyncio.sleep(options.backoff_factor *
+                                    (2**(attempt - 1)))
+            if host_bucket:
+                await asyncio.sleep(host_bucket.reserve())
+            timer.lap("wait")
+
+            try:
+                img_url_result = await self.download_once(
+                    img_url, output_directory, sub_directory, options,
+                    host_bucket, timer, self.get_timeout(options, deadline),
+                    ttfb_timeout, race)
+            except (self.aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError) as e:
+                if host_bucket:
+                    host_bucket.on_throttle()
+                img_url_result = ImgUrlResult(status="fail",
+                                              message=f"{type(e)}",
+                                              img_url=img_url,
+                                              img_path=None)
+                continue
+
+            if img_url_result.status == "retry":
+                img_url_result.status = "fail"
+                continue
+
+            break
+
+        if img_url_result.status == "fail":
+            if race and race.lost(img_url_result):
+                img_url_result.message = "Another request of the image won."
+            elif deadline.passed():
+                img_url_result.message = (f"Deadline of {options.deadline}"
+                                          f" seconds exceeded.")
+        img_url_result.timings = timer.finish()
+        return img_url_result
+
+    async def download_once(self, img_url: str, output_directory: pathlib.Path,
+                            sub_directory: str, options: DownloadOptions,
+                            host_bucket=None,
+                            timer=None,
+                            timeout=None,
+                            ttfb_timeout=None,
+                            race: Optional[Race] = None) -> ImgUrlResult:
+        """Makes one request, ttfb_timeout bounding the wait for headers.
+        """
+        img_url_result = ImgUrlResult(status=None,
+                                      message=None,
+                                      img_url=img_url,
+                                      img_path=None)
+        session = self.get_session(options)
+        timer = timer or StageTimer()
+        timeout = timeout or self.get_timeout(options)
+        http_meta = find_http_meta(img_url, options)
+        request_headers = None
+
+        try:
+            if http_meta and options.revalidate == "head":
+                async with session.head(img_url,
+                                        allow_redirects=True,
+                                        timeout=timeout) as head_response:
+                    if head_response.status < 400 and http_meta.matches(
+                            head_response.headers):
+                        set_cached(img_url_result, http_meta)
+                        return img_url_result
+            elif http_meta:
+                request_headers = http_meta.request_headers()
+
+            request = session.get(img_url,
+                                  headers=request_headers,
+                                  timeout=timeout,
+                                  trace_request_ctx=timer)
+            async with await asyncio.wait_for(request,
+                                              ttfb_timeout) as response:
+                timer.lap("ttfb")
+                if host_bucket:
+                    if response.status in THROTTLE_STATUS_CODES:
+                        host_bucket.on_throttle()
+                    else:
+                        host_bucket.on_success()
+
+                if response.status == 304 and http_meta:
+                    set_cached(img_url_result, http_meta)
+                    return img_url_result
+
+                if response.status >= 400:
+                    img_url_result.status = (
+                        "retry"
+                        if response.status in RETRY_STATUS_CODES else "fail")
+                    img_url_result.message = (
+                        f"img_url response is not ok."
+                        f" response: <Response [{response.status}]>.")
+                    return img_url_result
+
+                check_image_headers(response.headers, options, img_url)
+
+                directory_path = get_img_directory(output_directory,
+                                                   sub_directory)
+                with PartFile(directory_path, options) as part:
+                    async for chunk in response.content.iter_chunked(
+                            options.chunk_size):
+                        part.write(chunk)
+                    timer.add("write", part.write_time)
+                    timer.lap("body")
+                    timer.timings["body"] -= part.write_time
+
+                    if race and not race.claim(img_url_result):
+                        raise RaceLost()
+
+                    def store():
+                        save_image(part,
+                                   img_url_result,
+                                   response.headers.get("Content-Type", ""),
+                                   directory_path,
+                                   options,
+                                   http_meta=http_meta)
+                        remember_http_meta(img_url_result, response.headers,
+                                           part.size, options)
+
+                    # Perceptual hashes and the sqlite indexes would block
+                    # every download of the loop.
+                    await self.loop.run_in_executor(None, store)
+                    timer.lap("write")
+
+        except (self.aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            raise
+
+        except ImageRejected as e:
+            img_url_result.status = "fail"
+            img_url_result.message = f"Image rejected. {e}"
+
+        except Exception as exception:
+            img_url_result.status = "fail"
+            img_url_result.message = (f"Something is wrong here. Error:"
+                                      f" {type(exception)}: {exception}")
+
+        return img_url_result
+
+
+def make_engine(name: str, num_workers=0, concurrency=100):
+    if name == "async":
+        return AsyncEngine(concurrency)
+    if num_workers:
+        return PoolEngine(num_workers)
+
+    return SyncEngine()
@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, Optional
+
+from .deadline import abort_response
+
+# Recent image times needed before the first hedge.
+MIN_SAMPLES = 20
+WINDOW = 1000
+HEDGE_THREADS = 16
+
+# Per process, as hedged requests run in pool workers too.
+_TRACKERS = {}  # type: Dict[int, LatencyTracker]
+_EXECUTORS = {}  # type: Dict[int, ThreadPoolExecutor]
+_LOCK = threading.Lock()
+
+
+class RaceLost(Exception):
+    pass
+
+
+class LatencyTracker():
+    """Times of the last WINDOW images downloaded by the process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.deque(maxlen=WINDOW)
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Returns None until MIN_SAMPLES images are observed.
+        """
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            samples = sorted(self.samples)
+
+        return samples[min(int(len(samples) * percentile / 100),
+                           len(samples) - 1)]
+
+
+class Race():
+    """Requests of one image running at once, the first success wins.
+
+    An attempt, its ImgUrlResult, claims the race before saving the image.
+    Responses of the other attempts are aborted then, so a loser stuck on
+    a slow host doesn't hold its thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.responses = {}  # type: Dict[int, object]
+
+    def start(self, attempt, response):
+        with self.lock:
+            self.responses[id(attempt)] = response
+            lost = self.winner is not None
+        if lost:
+            abort_response(response)
+
+    def claim(self, attempt) -> bool:
+        with self.lock:
+            if self.winner is not None:
+                return self.winner is attempt
+            self.winner = attempt
+            losers = [
+                response for key, response in self.responses.items()
+                if key != id(attempt)
+            ]
+        for response in losers:
+            abort_response(response)
+
+        return True
+
+    def lost(self, attempt) -> bool:
+        return self.winner is not None and self.winner is not attempt
+
+
+def get_latency_tracker() -> LatencyTracker:
+    with _LOCK:
+        tracker = _TRACKERS.get(os.getpid())
+        if tracker is None:
+            tracker = _TRACKERS[os.getpid()] = LatencyTracker()
+
+    return tracker
+
+
+def get_hedge_delay(options) -> Optional[float]:
+    """Returns options.hedge_percentile of recent image times, if known.
+    """
+    if not options.hedge_percentile:
+        return None
+
+    return get_latency_tracker().percentile(options.hedge_percentile)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    with _LOCK:
+        executor = _EXECUTORS.get(os.getpid())
+        if executor is None:
+            executor = _EXECUTORS[os.getpid()] = ThreadPoolExecutor(
+                HEDGE_THREADS)
+
+    return executor
+
+
+def run_hedged(download: Callable, primary, hedge, delay: float):
+    """Runs download(primary, race), and download(hedge, race) as well if
+    the first takes longer than delay.
+
+    Returns the first result not failed, else the one of primary.
+    """
+    race = Race()
+    futures = [get_executor().submit(download, primary, race)]
+    if not wait(futures, timeout=delay).done:
+        futures.append(get_executor().submit(download, hedge, race))
+
+    for future in as_completed(futures):
+        img_url_result = future.result()
+        if img_url_result.status != "fail":
+            img_url_result.hedged = len(futures) > 1
+            return img_url_result
+
+    img_url_result = futures[0].result()
+    img_url_result.hedged = len(futures) > 1
+
+    return img_url_result
+
+
+async def run_hedged_async(download: Callable, primary, hedge, delay: float):
+    """run_hedged() for coroutines, the loser is cancelled.
+    """
+    race = Race()
+    tasks = [asyncio.ensure_future(download(primary, race))]
+    done, pending = await asyncio.wait(tasks, timeout=delay)
+    if pending:
+        tasks.append(asyncio.ensure_future(download(hedge, race)))
+
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                img_url_result = task.result()
+                if img_url_result.status != "fail":
+                    img_url_result.hedged = len(tasks) > 1
+                    return img_url_result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    img_url_result = tasks[0].result()
+    img_url_result.hedged = len(tasks) > 1
+
+    return img_url_result
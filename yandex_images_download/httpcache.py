@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import threading
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# One store per (process, path): sqlite connections must not cross a fork.
+_STORES = {}  # type: Dict[tuple, HttpMetaStore]
+_STORES_LOCK = threading.Lock()
+
+REVALIDATE_MODES = ["conditional", "head"]
+
+
+@dataclass
+class HttpMeta:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_length: Optional[int]
+    img_path: str
+
+    def request_headers(self) -> Dict[str, str]:
+        """Headers of a conditional GET for the image.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+    def matches(self, headers) -> bool:
+        """Tells if response headers, e.g. of a HEAD, are of the same image.
+        """
+        etag = headers.get("ETag")
+        if self.etag and etag:
+            return etag == self.etag
+
+        last_modified = headers.get("Last-Modified")
+        if not (self.last_modified and last_modified and
+                last_modified == self.last_modified):
+            return False
+
+        content_length = headers.get("Content-Length")
+        return (content_length is None or self.content_length is None or
+                int(content_length) == self.content_length)
+
+
+class HttpMetaStore():
+    """SQLite store of the validators of downloaded images by URL.
+
+    ETag, Last-Modified and Content-Length let a later run revalidate an
+    image instead of downloading it again.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path),
+                                          timeout=60,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS images ("
+                                " url TEXT PRIMARY KEY,"
+                                " etag TEXT,"
+                                " last_modified TEXT,"
+                                " content_length INTEGER,"
+                                " img_path TEXT)")
+
+    def find(self, url) -> Optional[HttpMeta]:
+        """Returns validators of url if its image is still on disk.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, content_length, img_path"
+                " FROM images WHERE url = ?", (url, )).fetchone()
+        if row is None or not os.path.exists(row[3]):
+            return None
+
+        return HttpMeta(*row)
+
+    def put(self, url, headers, content_length, img_path):
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_length, str(img_path)))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def get_http_meta_store(path) -> HttpMetaStore:
+    key = (os.getpid(), str(path))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = HttpMetaStore(path)
+
+    return store
@@ -0,0 +1,108 @@
+import json
+import logging
+
+from typing import Dict, Optional, Tuple
+
+from .downloader import ImgUrlResult, PageResult, KeywordResult
+from .sink import JsonlSink
+
+
+class Journal(JsonlSink):
+    """Append-only JSONL log of finished images, pages and keywords.
+
+    With resume=True the existing journal is read first, so completed work
+    can be skipped, and new records are appended to it.
+    """
+
+    def __init__(self, path, resume=False):
+        self.keywords = {}  # type: Dict[str, KeywordResult]
+        self.pages = {}  # type: Dict[Tuple[str, int], PageResult]
+        self.images = {}  # type: Dict[Tuple[str, str], ImgUrlResult]
+
+        if resume:
+            self.load(path)
+
+        super().__init__(path, "a" if resume else "w")
+
+    def load(self, path):
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+
+        keyword_records = []
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # the last line of a killed run.
+
+                if record["type"] == "image":
+                    img_url_result = ImgUrlResult.from_record(record["result"])
+                    self.images[(record["keyword"],
+                                 img_url_result.img_url)] = img_url_result
+                elif record["type"] == "page":
+                    page_result = PageResult.from_record(record["result"])
+                    self.pages[(record["keyword"],
+                                page_result.page)] = page_result
+                elif record["type"] == "keyword":
+                    keyword_records.append(record["result"])
+
+        for keyword_record in keyword_records:
+            keyword = keyword_record["keyword"]
+            page_results = sorted((page_result
+                                   for (page_keyword, _), page_result in
+                                   self.pages.items()
+                                   if page_keyword == keyword),
+                                  key=lambda page_result: page_result.page)
+            self.keywords[keyword] = KeywordResult(
+                status=keyword_record["status"],
+                message=keyword_record["message"],
+                keyword=keyword,
+                errors_count=keyword_record["errors_count"],
+                page_results=page_results)
+
+        logging.info(f"Journal {path}: {len(self.keywords)} keywords,"
+                     f" {len(self.pages)} pages, {len(self.images)} images"
+                     f" done.")
+
+    def page_done(self, keyword, page_result: PageResult):
+        self.write({
+            "type": "page",
+            "keyword": keyword,
+            "result": page_result.to_record()
+        })
+
+    def keyword_done(self, keyword_result: KeywordResult):
+        self.write({
+            "type": "keyword",
+            "keyword": keyword_result.keyword,
+            "result": {
+                "status": keyword_result.status,
+                "message": keyword_result.message,
+                "keyword": keyword_result.keyword,
+                "errors_count": keyword_result.errors_count
+            }
+        })
+
+    def find_keyword(self, keyword) -> Optional[KeywordResult]:
+        """Returns the result of a keyword done before, not failed.
+        """
+        keyword_result = self.keywords.get(keyword)
+        if keyword_result and keyword_result.status != "fail":
+            return keyword_result
+
+        return None
+
+    def find_page(self, keyword, page) -> Optional[PageResult]:
+        return self.pages.get((keyword, page))
+
+    def find_image(self, keyword, img_url) -> Optional[ImgUrlResult]:
+        """Returns the result of an image downloaded before, not failed.
+        """
+        img_url_result = self.images.get((keyword, img_url))
+        if img_url_result and img_url_result.status != "fail":
+            return img_url_result
+
+        return None
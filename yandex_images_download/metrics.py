@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict
+
+PREFIX = "yandex_images_download_"
+
+# Upper bounds of histogram buckets, seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+
+
+class Histogram():
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics():
+    """Counters and histograms of the current process, by name and labels.
+
+    Image downloads in pool workers are measured in the worker and carried
+    back in ImgUrlResult.timings, see observe_img_url_result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # type: Dict[tuple, float]
+        self.histograms = {}  # type: Dict[tuple, Histogram]
+
+    @staticmethod
+    def make_key(name, labels) -> tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = Metrics.make_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value: float, **labels):
+        key = Metrics.make_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [{
+                    "name": name,
+                    "labels": dict(labels),
+                    "value": value
+                } for (name, labels), value in sorted(self.counters.items())],
+                "histograms": [{
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": dict(histogram.cumulative_counts())
+                } for (name, labels), histogram in sorted(
+                    self.histograms.items())]
+            }
+
+    def to_prometheus(self) -> str:
+        """Returns metrics in the Prometheus text exposition format.
+        """
+        def format_labels(labels, **extra):
+            labels = {**dict(labels), **extra}
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{name}="{value}"'
+                                  for name, value in labels.items()) + "}"
+
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} counter")
+                    typed.add(name)
+                lines.append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                    typed.add(name)
+                for bound, count in histogram.cumulative_counts():
+                    lines.append(f"{PREFIX}{name}_bucket"
+                                 f"{format_labels(labels, le=bound)} {count}")
+                lines.append(f"{PREFIX}{name}_bucket"
+                             f"{format_labels(labels, le='+Inf')}"
+                             f" {histogram.count}")
+                lines.append(f"{PREFIX}{name}_sum{format_labels(labels)}"
+                             f" {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(labels)}"
+                             f" {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class StageTimer():
+    """Wall time of the consecutive stages of one operation, seconds.
+    """
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.timings = {}  # type: Dict[str, float]
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.add(stage, now - self.last)
+        self.last = now
+
+    def add(self, stage, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0) + seconds
+
+    def finish(self) -> Dict[str, float]:
+        self.timings["total"] = time.perf_counter() - self.start
+        return self.timings
+
+
+def observe_img_url_result(img_url_result, metrics=METRICS):
+    metrics.inc("images_total", status=img_url_result.status)
+    if img_url_result.source_url:
+        metrics.inc("alternate_sources_total")
+    if img_url_result.hedged:
+        metrics.inc("hedged_images_total")
+    for stage, seconds in (img_url_result.timings or {}).items():
+        metrics.observe("image_seconds", seconds, stage=stage)
+
+
+class MetricsServer():
+    """Serves METRICS for Prometheus at http://host:port/metrics.
+    """
+
+    def __init__(self, port, host="127.0.0.1", metrics=METRICS):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsWriter():
+    """Writes a JSON snapshot of METRICS to path every interval seconds,
+    and once more on close.
+    """
+
+    def __init__(self, path, interval=10, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.metrics.snapshot(), f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.write()
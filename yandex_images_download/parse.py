@@ -1,15 +1,24 @@
 import argparse
 import logging
 from .downloader import DRIVER_NAME_TO_CLASS
+from .engine import ENGINE_NAMES
+from .httpcache import REVALIDATE_MODES
+from .planner import LIMIT_TARGETS
+from .postprocess import REENCODE_FORMATS
+from .profiles import PROFILES
+from .storage import LAYOUTS
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group = parser.add_mutually_exclusive_group()
 
     parser.add_argument("browser",
-                        help=("browser with WebDriver"),
+                        help=("browser with WebDriver. not needed to"
+                              " download images by url"),
                         type=str,
+                        nargs="?",
+                        default=None,
                         choices=list(DRIVER_NAME_TO_CLASS))
 
     parser.add_argument("-dp",
@@ -18,6 +27,12 @@ def parse_args():
                         type=str,
                         default=None)
 
+    parser.add_argument("--browsers",
+                        help=("number of browsers scraping keywords in"
+                              " parallel. default: 1"),
+                        type=int,
+                        default=1)
+
     input_group.add_argument(
         "-k",
         "--keywords",
@@ -44,6 +59,14 @@ def parse_args():
                              type=str,
                              default=None)
 
+    input_group.add_argument("-uf",
+                             "--urls-from-file",
+                             help=("download images by urls from a text file,"
+                                   " one line = one url, with the engine and"
+                                   " no browser"),
+                             type=str,
+                             default=None)
+
     parser.add_argument("-o",
                         "--output-directory",
                         help=("download images in a specific main directory"),
@@ -56,6 +79,14 @@ def parse_args():
                         type=int,
                         default=100)
 
+    parser.add_argument("--limit-target",
+                        help=("what --limit counts: submitted image urls or"
+                              " images not failed, overfetching urls by the"
+                              " observed failure rate. default: attempts"),
+                        type=str,
+                        default="attempts",
+                        choices=LIMIT_TARGETS)
+
     size_group = parser.add_mutually_exclusive_group()
 
     size_group.add_argument("--isize",
@@ -113,11 +144,326 @@ def parse_args():
                         type=str,
                         default=False)
 
+    parser.add_argument("--jsonl",
+                        help=("write a JSONL record for every image as soon"
+                              " as it is finished"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--http-cache-db",
+                        help=("SQLite store of ETag/Last-Modified of"
+                              " downloaded images: unchanged images are not"
+                              " downloaded again and get status \"cached\""),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--revalidate",
+                        help=("conditional: GET with If-None-Match and"
+                              " If-Modified-Since, head: HEAD and compare"
+                              " validators. default: conditional"),
+                        type=str,
+                        default="conditional",
+                        choices=REVALIDATE_MODES)
+
+    parser.add_argument("--layout",
+                        help=("flat: images in the keyword directory,"
+                              " sharded: ab/cd/<sha256>.ext fan-out"
+                              " directories. default: flat"),
+                        type=str,
+                        default="flat",
+                        choices=list(LAYOUTS))
+
+    parser.add_argument("--min-resolution",
+                        help=("decode every downloaded image and reject the"
+                              " ones smaller than WIDTH HEIGHT"),
+                        nargs=2,
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--max-resolution",
+                        help=("decode every downloaded image and reject the"
+                              " ones larger than WIDTH HEIGHT"),
+                        nargs=2,
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--verify-images",
+                        help=("decode every downloaded image and reject the"
+                              " ones that are broken"),
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("--reencode",
+                        help="re-encode downloaded images to this format",
+                        type=str,
+                        default=None,
+                        choices=list(REENCODE_FORMATS))
+
+    parser.add_argument("--thumbnail-size",
+                        help=("write JPEG thumbnails fitting SIZE x SIZE to"
+                              " a thumbnails directory next to the images"),
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--postprocess-workers",
+                        help=("number of processes decoding images."
+                              " default: number of CPUs"),
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--metrics-port",
+                        help=("serve counters and timing histograms for"
+                              " Prometheus at http://127.0.0.1:PORT/metrics"),
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--metrics-json",
+                        help=("write a JSON snapshot of counters and timing"
+                              " histograms to this file periodically"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--metrics-interval",
+                        help=("seconds between --metrics-json snapshots."
+                              " default: 10"),
+                        type=float,
+                        default=10)
+
+    parser.add_argument("--journal",
+                        help=("append finished images, pages and keywords to"
+                              " this JSONL file as they complete"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--work-queue",
+                        help=("SQLite database of keywords shared by"
+                              " processes on several nodes: keywords given"
+                              " are added to it, then keywords are taken"
+                              " from it until it is done"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--lease-time",
+                        help=("seconds a keyword of --work-queue is leased"
+                              " for, renewed while it is in progress."
+                              " default: 600"),
+                        type=float,
+                        default=600)
+
+    parser.add_argument("--max-attempts",
+                        help=("attempts at a keyword of --work-queue before"
+                              " it is failed. default: 3"),
+                        type=int,
+                        default=3)
+
+    parser.add_argument("--resume",
+                        help=("skip keywords, pages and images already done"
+                              " according to --journal"),
+                        default=False,
+                        action="store_true")
+
     parser.add_argument("--num-workers",
                         help="number of workers",
                         type=int,
                         default=0)
 
+    parser.add_argument("--serp-rate",
+                        help=("initial search pages per second. adapts to"
+                              " captcha and errors. default: 2"),
+                        type=float,
+                        default=2.0)
+
+    parser.add_argument("--host-rate",
+                        help=("initial image requests per second per host in"
+                              " each worker. adapts to 429 and errors."
+                              " default: unlimited"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--no-capture",
+                        help=("run browsers without the selenium-wire proxy;"
+                              " search page status codes are not known"),
+                        dest="capture",
+                        default=True,
+                        action="store_false")
+
+    parser.add_argument("--browser-profile",
+                        help=("how browsers load search pages. lean: no"
+                              " images, fonts, media and ad hosts, parse"
+                              " as soon as results are on the page."
+                              " headless: lean without a window, a captcha"
+                              " stops the run. default: default"),
+                        type=str,
+                        default="default",
+                        choices=list(PROFILES))
+
+    parser.add_argument("--http-serp",
+                        help=("load search pages over HTTP with the browser's"
+                              " cookies, use the browser only for captcha"),
+                        default=False,
+                        action="store_true")
+
+    parser.add_argument("--serp-cache",
+                        help=("sqlite cache of search result pages. cached"
+                              " pages are not loaded again"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--serp-cache-ttl",
+                        help=("seconds a cached search page is valid."
+                              " default: 86400"),
+                        type=float,
+                        default=24 * 60 * 60)
+
+    parser.add_argument("--serp-cache-size",
+                        help=("maximum number of cached search pages,"
+                              " least recently used are evicted."
+                              " default: 10000"),
+                        type=int,
+                        default=10000)
+
+    parser.add_argument("--engine",
+                        help=("image downloading engine: processes of"
+                              " --num-workers or asyncio. default: pool"),
+                        type=str,
+                        default="pool",
+                        choices=ENGINE_NAMES)
+
+    parser.add_argument("--concurrency",
+                        help=("number of images downloaded at once by the"
+                              " async engine. default: 100"),
+                        type=int,
+                        default=100)
+
+    parser.add_argument("--pipeline",
+                        help=("keep scraping next pages and keywords while"
+                              " images are downloading"),
+                        default=False,
+                        action="store_true")
+
+    parser.add_argument("--queue-size",
+                        help=("number of images waiting for download in"
+                              " --pipeline mode. default: 100"),
+                        type=int,
+                        default=100)
+
+    parser.add_argument("--stream",
+                        help=("stream images to disk in chunks and skip"
+                              " responses that are not images"),
+                        default=False,
+                        action="store_true")
+
+    parser.add_argument("--max-bytes",
+                        help=("skip images larger than this number of bytes."
+                              " implies --stream"),
+                        type=int,
+                        default=None)
+
+    parser.add_argument("--dedup-db",
+                        help=("sqlite index of downloaded images. skips known"
+                              " URLs and stores equal images once"),
+                        type=str,
+                        default=None)
+
+    parser.add_argument("--dedup-mode",
+                        help=("how to store an image equal to a downloaded"
+                              " one: hardlink to it or only reference it in"
+                              " the results. default: hardlink"),
+                        type=str,
+                        default="hardlink",
+                        choices=["hardlink", "reference"])
+
+    parser.add_argument("--dedup-phash",
+                        help=("also treat images with equal perceptual hash"
+                              " as duplicates. requires Pillow"),
+                        default=False,
+                        action="store_true")
+
+    parser.add_argument("--connect-timeout",
+                        help=("seconds to connect to an image host."
+                              " default: 10"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--ttfb-timeout",
+                        help=("seconds to wait for the response headers of"
+                              " an image. default: 10"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--deadline",
+                        help=("total seconds an image may take, slow-drip"
+                              " bodies and alternates included."
+                              " default: unlimited"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--hedge-percentile",
+                        help=("once an image takes longer than this"
+                              " percentile of recent images, also request"
+                              " its first alternate, or the image again,"
+                              " and keep the first to finish. e.g. 95"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--alternates",
+                        help=("number of other sources of an image from its"
+                              " search page, other sizes and the Yandex"
+                              " thumbnail, to try when it fails. default: 0"),
+                        type=int,
+                        default=0)
+
+    parser.add_argument("--slow-ttfb",
+                        help=("with --alternates, seconds to wait for the"
+                              " response headers of a source before trying"
+                              " the next one. default: the request timeout"),
+                        type=float,
+                        default=None)
+
+    parser.add_argument("--prewarm",
+                        help=("resolve hosts of a page's images and open"
+                              " connections to them before they download"),
+                        default=False,
+                        action="store_true")
+
+    parser.add_argument("--pool-maxsize",
+                        help=("number of keep-alive connections per host"
+                              " in each worker. default: 10"),
+                        type=int,
+                        default=10)
+
+    parser.add_argument("--retries",
+                        help="retries of a failed image request. default: 3",
+                        type=int,
+                        default=3)
+
+    parser.add_argument("--backoff-factor",
+                        help=("backoff factor between retries in seconds."
+                              " default: 0.3"),
+                        type=float,
+                        default=0.3)
+
     args = parser.parse_args()
 
+    if not (args.keywords or args.keywords_from_file or args.single_image or
+            args.urls_from_file or args.work_queue):
+        parser.error("one of the arguments -k/--keywords"
+                     " -kf/--keywords-from-file -x/--single-image"
+                     " -uf/--urls-from-file --work-queue is required")
+
+    if (args.keywords or args.keywords_from_file or
+            args.work_queue) and not args.browser:
+        parser.error("the argument browser is required to search keywords")
+
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+
+    if args.hedge_percentile is not None and not (
+            0 < args.hedge_percentile < 100):
+        parser.error("--hedge-percentile must be between 0 and 100")
+
+    if args.reencode and args.dedup_db and args.dedup_mode == "reference":
+        # Re-encoding moves the file duplicates refer to.
+        parser.error("--reencode can't be used with --dedup-mode reference")
+
     return args
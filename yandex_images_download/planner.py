@@ -0,0 +1,107 @@
+import math
+import threading
+
+from concurrent.futures import Future, wait
+
+LIMIT_TARGETS = ["attempts", "successes"]
+
+
+class FailureStats():
+    """Share of failed images among finished ones, for the whole run.
+
+    Starts from prior_rate as if prior_weight images were already seen,
+    so the first failures don't make the estimate jump.
+    """
+
+    def __init__(self, prior_rate=0.1, prior_weight=10):
+        self.lock = threading.Lock()
+        self.failed = prior_rate * prior_weight
+        self.finished = prior_weight
+
+    def record(self, failed: bool):
+        with self.lock:
+            self.finished += 1
+            if failed:
+                self.failed += 1
+
+    @property
+    def failure_rate(self) -> float:
+        with self.lock:
+            return min(self.failed / self.finished, 0.95)
+
+
+class KeywordPlan():
+    """Decides how many image URLs of a keyword to take from the next page.
+
+    With target "attempts" the limit is the number of URLs submitted. With
+    target "successes" it is the number of images not failed, and URLs are
+    overfetched by the observed failure rate, counting images in flight
+    as their expected successes.
+    """
+
+    def __init__(self, limit, target, stats: FailureStats, per_page):
+        self.limit = limit
+        self.target = target
+        self.stats = stats
+        self.per_page = per_page
+
+        self.lock = threading.Lock()
+        self.attempts = 0
+        self.successes = 0
+        self.pending = set()
+
+    def track(self, future: Future):
+        with self.lock:
+            self.attempts += 1
+            self.pending.add(future)
+        future.add_done_callback(self.on_done)
+
+    def on_done(self, future: Future):
+        """Counts a finished image, a future that raised being a failure.
+        """
+        failed = True
+        try:
+            failed = (future.cancelled() or future.exception() is not None or
+                      future.result().status == "fail")
+        finally:
+            self.stats.record(failed)
+            with self.lock:
+                self.pending.discard(future)
+                if not failed:
+                    self.successes += 1
+
+    def add_results(self, img_url_results):
+        """Counts results of a page done in an earlier run.
+        """
+        with self.lock:
+            self.attempts += len(img_url_results)
+            self.successes += sum(
+                1 if img_url_result.status != "fail" else 0
+                for img_url_result in img_url_results)
+
+    def urls_to_take(self) -> int:
+        if self.target == "attempts":
+            return max(0, self.limit - self.attempts)
+
+        success_rate = 1 - self.stats.failure_rate
+        with self.lock:
+            expected = self.successes + len(self.pending) * success_rate
+
+        return max(0, math.ceil((self.limit - expected) / success_rate))
+
+    def has_pending(self) -> bool:
+        with self.lock:
+            return bool(self.pending)
+
+    def wait(self):
+        """Waits for images in flight, to see if more are needed.
+
+        Only target "successes" can need more, the attempts made with
+        target "attempts" don't change when images finish.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+
+    def pages_needed(self, pages_done) -> int:
+        return pages_done + math.ceil(self.urls_to_take() / self.per_page)
@@ -0,0 +1,149 @@
+import os
+import pathlib
+import time
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .downloader import ImgUrlResult, ImageRejected
+
+REENCODE_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+THUMBNAILS_DIRECTORY = "thumbnails"
+
+
+@dataclass
+class PostprocessOptions:
+    min_resolution: Optional[Tuple[int, int]] = None
+    max_resolution: Optional[Tuple[int, int]] = None
+    reencode: Optional[str] = None
+    thumbnail_size: Optional[int] = None
+
+
+def check_resolution(width, height, options: PostprocessOptions):
+    if options.min_resolution:
+        min_width, min_height = options.min_resolution
+        if width < min_width or height < min_height:
+            raise ImageRejected(f"Resolution {width}x{height} is below"
+                                f" {min_width}x{min_height}.")
+    if options.max_resolution:
+        max_width, max_height = options.max_resolution
+        if width > max_width or height > max_height:
+            raise ImageRejected(f"Resolution {width}x{height} is above"
+                                f" {max_width}x{max_height}.")
+
+
+def postprocess_image(img_url_result: ImgUrlResult,
+                      options: PostprocessOptions) -> ImgUrlResult:
+    """Decodes the downloaded image and fills its format and resolution.
+
+    Images that don't decode or are out of the resolution bounds are
+    deleted and marked failed. Duplicates are only checked, their files
+    may be referenced by other results. Runs in a Postprocessor worker.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    img_path = pathlib.Path(img_url_result.img_path)
+    owned = img_url_result.status == "success"
+
+    try:
+        with Image.open(img_path) as image:
+            image.verify()
+        with Image.open(img_path) as image:
+            image.load()
+            img_url_result.img_format = image.format
+            img_url_result.width, img_url_result.height = image.size
+            check_resolution(image.width, image.height, options)
+
+            if owned and options.thumbnail_size:
+                thumbnail_path = (img_path.parent / THUMBNAILS_DIRECTORY /
+                                  img_path.with_suffix(".jpg").name)
+                thumbnail_path.parent.mkdir(exist_ok=True)
+                thumbnail = image.convert("RGB")
+                thumbnail.thumbnail(
+                    (options.thumbnail_size, options.thumbnail_size))
+                thumbnail.save(thumbnail_path, "JPEG")
+                img_url_result.thumbnail_path = str(thumbnail_path)
+
+            if (owned and options.reencode and
+                    options.reencode != image.format):
+                reencoded_path = img_path.with_suffix(
+                    REENCODE_FORMATS[options.reencode])
+                if reencoded_path.exists():
+                    reencoded_path = img_path.with_name(
+                        img_path.name + REENCODE_FORMATS[options.reencode])
+                if options.reencode == "JPEG":
+                    image = image.convert("RGB")
+                image.save(reencoded_path, options.reencode)
+                img_url_result.img_format = options.reencode
+                img_url_result.img_path = str(reencoded_path)
+
+    except Exception as e:
+        if owned:
+            os.remove(img_path)
+        img_url_result.status = "fail"
+        img_url_result.img_path = None
+        if isinstance(e, ImageRejected):
+            img_url_result.message = f"Image rejected. {e}"
+        else:
+            img_url_result.message = (f"Image rejected. Not a decodable"
+                                      f" image: {type(e).__name__} {e}.")
+
+    else:
+        if img_url_result.img_path != str(img_path):
+            os.remove(img_path)
+
+    if img_url_result.timings is not None:
+        img_url_result.timings["postprocess"] = time.perf_counter() - start
+
+    return img_url_result
+
+
+class Postprocessor():
+    """Runs postprocess_image on downloaded images in worker processes.
+
+    Decoding is CPU bound, so it has a ProcessPoolExecutor of its own and
+    never holds up the image downloading engine.
+    """
+
+    def __init__(self, options: PostprocessOptions, num_workers=None):
+        try:
+            import PIL
+        except ImportError:
+            raise ImportError("Image postprocessing requires Pillow:"
+                              " pip install Pillow") from None
+        self.options = options
+        self.executor = ProcessPoolExecutor(num_workers)
+
+    def submit(self, download_future: Future) -> Future:
+        """Returns a future of the image postprocessed after download_future.
+        """
+        future = Future()
+
+        def on_processed(processed_future):
+            try:
+                future.set_result(processed_future.result())
+            except Exception as e:
+                future.set_exception(e)
+
+        def on_downloaded(download_future):
+            try:
+                img_url_result = download_future.result()
+            except Exception as e:
+                future.set_exception(e)
+                return
+
+            if img_url_result.img_path is None:
+                future.set_result(img_url_result)
+                return
+
+            self.executor.submit(postprocess_image, img_url_result,
+                                 self.options).add_done_callback(on_processed)
+
+        download_future.add_done_callback(on_downloaded)
+
+        return future
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,185 @@
+import logging
+
+from dataclasses import dataclass, field
+from selenium import webdriver as selenium_webdriver
+from selenium.webdriver.support.ui import WebDriverWait
+from typing import Dict, List
+
+# Ads, counters and widgets of search pages. Only data-bem of the page's
+# html is read, nothing these hosts serve is needed.
+BLOCKED_HOSTS = [
+    "mc.yandex.ru",
+    "an.yandex.ru",
+    "yabs.yandex.ru",
+    "awaps.yandex.net",
+    "ads.adfox.ru",
+    "favicon.yandex.net",
+    "www.google-analytics.com",
+    "www.googletagmanager.com",
+    "stats.g.doubleclick.net",
+]
+
+# Thumbnails of serp items and images in general.
+IMAGE_URLS = [
+    "*//avatars.mds.yandex.net/*",
+    "*-tub-*.yandex.net/*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.png*",
+    "*.gif*",
+    "*.webp*",
+    "*.svg*",
+]
+
+FONT_AND_MEDIA_URLS = [
+    "*.woff*",
+    "*.ttf*",
+    "*.otf*",
+    "*.mp4*",
+    "*.webm*",
+]
+
+# Search page is parsed as soon as it has the serp list or the captcha.
+READY_SCRIPT = ('return document.readyState === "complete" ||'
+                ' (document.readyState === "interactive" &&'
+                ' document.querySelector(".serp-list, .serp-item,'
+                ' .form__captcha") !== null);')
+READY_TIMEOUT = 30
+
+CHROMIUM_OPTIONS = {"Chrome": "ChromeOptions", "Edge": "EdgeOptions"}
+
+# Attribute of a started driver that holds its BrowserProfile. Not
+# "profile", which Firefox of selenium 3 removes on quit().
+PROFILE_ATTR = "yandex_images_download_profile"
+
+
+@dataclass
+class BrowserProfile:
+    """How a browser is started to load search pages.
+
+    "eager" page_load_strategy returns from driver.get() at
+    DOMContentLoaded, wait_page_ready() then waits for the serp list.
+    """
+    headless: bool = False
+    block_images: bool = False
+    block_fonts_and_media: bool = False
+    blocked_hosts: List[str] = field(default_factory=list)
+    page_load_strategy: str = "normal"
+
+    @property
+    def is_default(self) -> bool:
+        return self == BrowserProfile()
+
+    def blocked_urls(self, images=True) -> List[str]:
+        urls = [f"*//{host}/*" for host in self.blocked_hosts]
+        if self.block_fonts_and_media:
+            urls += FONT_AND_MEDIA_URLS
+        if self.block_images and images:
+            urls += IMAGE_URLS
+
+        return urls
+
+
+PROFILES = {
+    "default":
+        BrowserProfile(),
+    "lean":
+        BrowserProfile(block_images=True,
+                       block_fonts_and_media=True,
+                       blocked_hosts=BLOCKED_HOSTS,
+                       page_load_strategy="eager"),
+    "headless":
+        BrowserProfile(headless=True,
+                       block_images=True,
+                       block_fonts_and_media=True,
+                       blocked_hosts=BLOCKED_HOSTS,
+                       page_load_strategy="eager"),
+}  # type: Dict[str, BrowserProfile]
+
+
+def is_chromium(driver) -> bool:
+    return hasattr(driver, "execute_cdp_cmd")
+
+
+def make_driver_args(name: str, profile: BrowserProfile) -> dict:
+    """Returns options of the browser's WebDriver for profile.
+
+    Chrome and Edge block urls over DevTools once started, see
+    setup_driver(). Firefox blocks hosts by resolving them to localhost.
+    Safari has neither headless mode nor blocking and runs as is.
+    """
+    if profile.is_default:
+        return {}
+
+    if name in CHROMIUM_OPTIONS:
+        options_class = getattr(selenium_webdriver, CHROMIUM_OPTIONS[name],
+                                None)
+        if options_class is None:
+            logging.warning(f"{name} of this selenium version has no"
+                            f" options, the browser profile is ignored.")
+            return {}
+        options = options_class()
+        if profile.headless:
+            options.add_argument("--headless")
+        if profile.block_fonts_and_media:
+            options.add_argument("--mute-audio")
+            options.add_argument("--autoplay-policy=user-gesture-required")
+    elif name == "Firefox":
+        options = selenium_webdriver.FirefoxOptions()
+        if profile.headless:
+            options.add_argument("-headless")
+        if profile.block_images:
+            options.set_preference("permissions.default.image", 2)
+        if profile.block_fonts_and_media:
+            options.set_preference("gfx.downloadable_fonts.enabled", False)
+            options.set_preference("media.autoplay.default", 5)
+        if profile.blocked_hosts:
+            options.set_preference("network.dns.localDomains",
+                                   ",".join(profile.blocked_hosts))
+    else:
+        logging.warning(f"{name} doesn't support browser profiles, it is"
+                        f" started with default settings.")
+        return {}
+
+    options.set_capability("pageLoadStrategy", profile.page_load_strategy)
+
+    return {"options": options}
+
+
+def block_urls(driver, urls: List[str]):
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": urls})
+
+
+def get_profile(driver) -> BrowserProfile:
+    return getattr(driver, PROFILE_ATTR, PROFILES["default"])
+
+
+def setup_driver(driver, profile: BrowserProfile):
+    """Applies the part of profile that needs a started browser.
+    """
+    setattr(driver, PROFILE_ATTR, profile)
+    if is_chromium(driver) and profile.blocked_urls():
+        block_urls(driver, profile.blocked_urls())
+
+
+def allow_images(driver, profile: BrowserProfile) -> bool:
+    """Unblocks images, e.g. of a captcha, returns False if it can't.
+    """
+    if not profile.block_images:
+        return True
+    if not is_chromium(driver):
+        return False
+
+    block_urls(driver, profile.blocked_urls(images=False))
+    return True
+
+
+def wait_page_ready(driver, profile: BrowserProfile):
+    """Waits for the serp list or captcha of a page loaded eagerly.
+    """
+    if profile.page_load_strategy == "normal":
+        return
+
+    WebDriverWait(driver, READY_TIMEOUT).until(
+        lambda driver: driver.execute_script(READY_SCRIPT))
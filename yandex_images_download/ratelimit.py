@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+from typing import Dict
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Bounds of an adaptive rate relative to the initial one.
+MAX_RATE_FACTOR = 4
+MIN_RATE_FACTOR = 1 / 20
+
+# Host buckets of the current process, by (pid, rate, host).
+_HOST_BUCKETS = {}  # type: Dict[tuple, TokenBucket]
+_HOST_BUCKETS_LOCK = threading.Lock()
+
+
+class TokenBucket():
+    """Token bucket whose rate adapts to responses.
+
+    The rate grows additively after clean responses and is cut in half on
+    captcha, 429 or connection errors (AIMD), within
+    [rate * MIN_RATE_FACTOR, rate * MAX_RATE_FACTOR].
+    """
+
+    def __init__(self, rate: float, burst=1, increase=None, decrease=0.5):
+        self.rate = rate
+        self.min_rate = rate * MIN_RATE_FACTOR
+        self.max_rate = rate * MAX_RATE_FACTOR
+        self.burst = burst
+        self.increase = increase if increase is not None else rate / 10
+        self.decrease = decrease
+
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes a token, returns the number of seconds to wait for it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+class RateLimiter():
+    """Rate of search result page loads, shared by all browsers.
+    """
+
+    def __init__(self, serp_rate=2.0):
+        self.serp = TokenBucket(serp_rate)
+
+
+def get_host_bucket(rate: float, host: str) -> TokenBucket:
+    """Returns the image host bucket of the current process.
+    """
+    key = (os.getpid(), rate, host)
+    with _HOST_BUCKETS_LOCK:
+        bucket = _HOST_BUCKETS.get(key)
+        if bucket is None:
+            bucket = _HOST_BUCKETS[key] = TokenBucket(rate)
+
+    return bucket
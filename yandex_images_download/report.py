@@ -0,0 +1,99 @@
+"""Rebuilds the nested --json report from a --jsonl or --journal file.
+
+Usage: python -m yandex_images_download.report results.jsonl report.json
+"""
+import argparse
+import json
+import logging
+
+from collections import OrderedDict
+
+from .downloader import (ImgUrlResult, PageResult, KeywordResult,
+                         DownloaderResult, write_json)
+
+
+def build_report(jsonl_path) -> DownloaderResult:
+    # keyword -> page -> index -> ImgUrlResult, in order of appearance.
+    images = OrderedDict()
+    pages = {}
+    keywords = {}
+
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            keyword = record["keyword"]
+            keyword_images = images.setdefault(keyword, {})
+            if record["type"] == "image":
+                keyword_images.setdefault(record["page"], {})[
+                    record["index"]] = ImgUrlResult.from_record(
+                        record["result"])
+            elif record["type"] == "page":
+                page_result = PageResult.from_record(record["result"])
+                keyword_images.setdefault(page_result.page, {})
+                pages[(keyword, page_result.page)] = page_result
+            elif record["type"] == "keyword":
+                keywords[keyword] = record["result"]
+
+    downloader_result = DownloaderResult(status="success",
+                                         message="Everything is downloaded!",
+                                         keyword_results=[])
+
+    for keyword, keyword_images in images.items():
+        keyword_result = KeywordResult(status="success",
+                                       message=None,
+                                       keyword=keyword,
+                                       errors_count=0,
+                                       page_results=[])
+
+        for page in sorted(keyword_images):
+            page_result = pages.get((keyword, page))
+            if page_result is None:
+                page_images = keyword_images[page]
+                img_url_results = [
+                    page_images[index] for index in sorted(page_images)
+                ]
+                page_result = PageResult(
+                    status="success",
+                    message=(f"All successful images from page"
+                             f" {page} downloaded."),
+                    page=page,
+                    errors_count=sum(
+                        1 if img_url_result.status == "fail" else 0
+                        for img_url_result in img_url_results),
+                    img_url_results=img_url_results)
+
+            keyword_result.page_results.append(page_result)
+            keyword_result.errors_count += page_result.errors_count
+
+        keyword_record = keywords.get(keyword)
+        if keyword_record:
+            keyword_result.status = keyword_record["status"]
+            keyword_result.message = keyword_record["message"]
+        else:
+            keyword_result.message = f"All images for {keyword} downloaded!"
+
+        downloader_result.keyword_results.append(keyword_result)
+
+    return downloader_result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="rebuild the nested json report from a jsonl file")
+    parser.add_argument("jsonl", help="--jsonl or --journal file", type=str)
+    parser.add_argument("json", help="report to write", type=str)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    downloader_result = build_report(args.jsonl)
+    write_json(args.json, downloader_result.to_record())
+    logging.info(f"Result information saved: {args.json}.")
+
+
+if __name__ == "__main__":
+    main()
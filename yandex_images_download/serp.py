@@ -0,0 +1,68 @@
+import logging
+
+from dataclasses import dataclass
+from typing import Optional
+
+from .metrics import METRICS
+from .serp_parser import SerpPage, parse_serp
+from .session import make_session
+
+
+@dataclass
+class SerpResponse:
+    ok: bool
+    status_code: int
+    page: SerpPage
+
+
+class HttpSerpFetcher():
+    """Fetches search result pages over plain HTTP.
+
+    The browser, if any, is used only to take its cookies and User-Agent,
+    so pages look like the ones the browser would get.
+    """
+
+    def __init__(self, driver=None, headers=None, timeout=10, retries=3,
+                 backoff_factor=0.3):
+        self.timeout = timeout
+        self.session = make_session(headers=headers,
+                                    pool_connections=1,
+                                    pool_maxsize=1,
+                                    retries=retries,
+                                    backoff_factor=backoff_factor)
+        if driver is not None:
+            self.update_from_driver(driver)
+
+    def update_from_driver(self, driver):
+        """Copies cookies and User-Agent, e.g. after a captcha is solved.
+        """
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(cookie["name"],
+                                     cookie["value"],
+                                     domain=cookie.get("domain", ""),
+                                     path=cookie.get("path", "/"))
+        user_agent = driver.execute_script("return navigator.userAgent")
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+
+    def fetch(self, url, params=None) -> Optional[SerpResponse]:
+        """Returns the page, or None if it is a captcha.
+        """
+        with METRICS.time("serp_seconds", stage="http"):
+            response = self.session.get(url,
+                                        params=params,
+                                        timeout=self.timeout)
+        with METRICS.time("serp_seconds", stage="parse"):
+            serp_page = parse_serp(response.text)
+
+        if "showcaptcha" in response.url or serp_page.captcha:
+            logging.info("  Captcha on HTTP request, falling back to browser.")
+            METRICS.inc("captchas_total")
+            return None
+
+        return SerpResponse(ok=response.ok,
+                            status_code=response.status_code,
+                            page=serp_page)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,86 @@
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+from .serp_parser import SerpPage, make_serp_item
+
+
+class SerpCache():
+    """On-disk cache of parsed search result pages.
+
+    Pages are keyed by their exact query parameters, expire after ttl
+    seconds, and the least recently used ones are evicted above
+    max_entries.
+    """
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path),
+                                          timeout=60,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pages ("
+                                " key TEXT PRIMARY KEY,"
+                                " last_page INTEGER,"
+                                " items TEXT,"
+                                " created REAL,"
+                                " accessed REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_accessed"
+                                " ON pages (accessed)")
+        with self.lock:
+            self.connection.execute("DELETE FROM pages WHERE created < ?",
+                                    (time.time() - self.ttl, ))
+
+    @staticmethod
+    def make_key(params) -> str:
+        return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+    def get(self, params) -> Optional[SerpPage]:
+        key = SerpCache.make_key(params)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT last_page, items, created FROM pages WHERE key = ?",
+                (key, )).fetchone()
+            if row is None:
+                return None
+
+            last_page, items, created = row
+            if created < now - self.ttl:
+                self.connection.execute("DELETE FROM pages WHERE key = ?",
+                                        (key, ))
+                return None
+
+            self.connection.execute(
+                "UPDATE pages SET accessed = ? WHERE key = ?", (now, key))
+
+        return SerpPage(captcha=False,
+                        last_page=last_page,
+                        items=[make_serp_item(data)
+                               for data in json.loads(items)])
+
+    def put(self, params, serp_page: SerpPage):
+        key = SerpCache.make_key(params)
+        items = json.dumps([item.data for item in serp_page.items],
+                           ensure_ascii=False)
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (key, serp_page.last_page, items, now, now))
+            self.connection.execute(
+                "DELETE FROM pages WHERE key IN ("
+                " SELECT key FROM pages ORDER BY accessed DESC"
+                " LIMIT -1 OFFSET ?)", (self.max_entries, ))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
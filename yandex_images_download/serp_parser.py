@@ -0,0 +1,119 @@
+import html
+import json
+import re
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Start tag with its attributes. Quoted attribute values may contain ">",
+# e.g. in data-bem of serp items with html snippets. Comments and script and
+# style elements are matched whole, so markup in them is skipped. Their
+# bodies are matched a "<" at a time, which is as fast as the tags alone.
+TAG_RE = re.compile(
+    r"""<(?:!--(?:[^-]|-(?!->))*(?:-->)?"""
+    r"""|((?i:script|style))\b(?:[^>"']|"[^"]*"|'[^']*')*>"""
+    r"""[^<]*(?:<(?!(?i:/\1)\s*>)[^<]*)*(?:(?i:</\1)\s*>)?"""
+    r"""|(?P<name>[a-zA-Z][\w-]*)(?P<attrs>(?:\s+(?:[^>"']|"[^"]*"|'[^']*')*)?)/?>)""")
+ATTR_RE = re.compile(r"""([^\s"'=<>/]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))""")
+MARKERS = ("serp-item", "serp-list", "form__captcha")
+
+
+@dataclass
+class SerpItem:
+    img_href: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    file_size: Optional[int] = None
+    data: dict = field(default_factory=dict)
+
+    def alternate_urls(self) -> List[str]:
+        """Other sources of the image, largest first, Yandex thumbnail last.
+
+        previews and dups of data-bem are copies of the image of other
+        sizes, often on other hosts.
+        """
+        sources = sorted(
+            (source for key in ("preview", "dups")
+             for source in self.data.get(key) or [] if source.get("url")),
+            key=lambda source: (source.get("w") or 0) *
+            (source.get("h") or 0),
+            reverse=True)
+        urls = [source["url"] for source in sources]
+        thumb = (self.data.get("thumb") or {}).get("url")
+        if thumb:
+            urls.append(thumb)
+
+        alternate_urls = []
+        for url in urls:
+            # Thumbnails are protocol-relative.
+            url = f"https:{url}" if url.startswith("//") else url
+            if url != self.img_href and url not in alternate_urls:
+                alternate_urls.append(url)
+
+        return alternate_urls
+
+
+@dataclass
+class SerpPage:
+    captcha: bool = False
+    last_page: Optional[int] = None
+    items: List[SerpItem] = field(default_factory=list)
+
+    @property
+    def img_hrefs(self) -> List[str]:
+        return [item.img_href for item in self.items]
+
+
+def parse_attrs(attrs: str) -> dict:
+    result = {}
+    for match in ATTR_RE.finditer(attrs):
+        name, double, single, bare = match.groups()
+        value = double if double is not None else (
+            single if single is not None else bare)
+        result[name.lower()] = html.unescape(value)
+
+    return result
+
+
+def make_serp_item(data: dict) -> SerpItem:
+    serp_item = SerpItem(img_href=data["img_href"], data=data)
+
+    previews = data.get("preview") or []
+    if previews:
+        serp_item.width = previews[0].get("w")
+        serp_item.height = previews[0].get("h")
+        serp_item.file_size = previews[0].get("fileSizeInBytes")
+
+    return serp_item
+
+
+def parse_serp(page_source: str) -> SerpPage:
+    """Extracts captcha presence, lastPage and serp items in one pass.
+
+    Only start tags that mention one of MARKERS get their attributes parsed.
+    """
+    serp_page = SerpPage()
+
+    for match in TAG_RE.finditer(page_source):
+        attrs = match.group("attrs")
+        if attrs is None or not any(marker in attrs for marker in MARKERS):
+            continue
+
+        attrs = parse_attrs(attrs)
+        classes = attrs.get("class", "").split()
+
+        if "form__captcha" in classes:
+            serp_page.captcha = True
+            continue
+
+        if match.group("name").lower() != "div" or "data-bem" not in attrs:
+            continue
+
+        if "serp-list" in classes and serp_page.last_page is None:
+            data_bem = json.loads(attrs["data-bem"])
+            serp_page.last_page = data_bem["serp-list"]["lastPage"]
+        elif "serp-item" in classes:
+            data_bem = json.loads(attrs["data-bem"])
+            serp_page.items.append(make_serp_item(data_bem["serp-item"]))
+
+    return serp_page
@@ -0,0 +1,147 @@
+import logging
+import os
+import requests
+import socket
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# A host is prewarmed again only after this many seconds.
+PREWARM_TTL = 30
+
+# One session per (process, settings): sockets must never be shared
+# between a parent and its forked pool workers.
+_SESSIONS = {}  # type: Dict[tuple, requests.Session]
+
+
+def make_session(headers=None,
+                 cookies=None,
+                 pool_connections=10,
+                 pool_maxsize=10,
+                 retries=3,
+                 backoff_factor=0.3) -> requests.Session:
+    """Creates a keep-alive session.
+
+    pool_connections is the number of hosts to keep pools for,
+    pool_maxsize is the number of connections kept per host.
+    """
+    session = requests.Session()
+
+    retry = Retry(total=retries,
+                  connect=retries,
+                  read=retries,
+                  status=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUS_CODES,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize,
+                          max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    if headers:
+        session.headers.update(headers)
+    if cookies:
+        session.cookies.update(cookies)
+
+    return session
+
+
+def get_session(options, retries=True) -> requests.Session:
+    """Returns the session of the current process for DownloadOptions.
+
+    The session without retries shares connection pools with the one with
+    them, so both reuse the same keep-alive connections.
+    """
+    key = (os.getpid(), options.session_key(), retries)
+    session = _SESSIONS.get(key)
+    if session is None:
+        session = make_session(headers=options.headers,
+                               cookies=options.cookies,
+                               pool_connections=options.pool_connections,
+                               pool_maxsize=options.pool_maxsize,
+                               retries=options.retries if retries else 0,
+                               backoff_factor=options.backoff_factor)
+        if not retries:
+            # One adapter serves both http and https.
+            adapter = get_session(options).get_adapter("https://")
+            session.get_adapter("https://").poolmanager = adapter.poolmanager
+        _SESSIONS[key] = session
+
+    return session
+
+
+def close_sessions():
+    for session in _SESSIONS.values():
+        session.close()
+    _SESSIONS.clear()
+
+
+def prewarm_connection(url, options):
+    """Opens a connection to the host of url in the session's pool.
+
+    The connection of a HEAD request of url goes back to the pool, so the
+    next request to the host reuses it and skips DNS, TCP and TLS.
+    """
+    timeout = options.connect_timeout or options.timeout
+    with get_session(options).head(url,
+                                   timeout=timeout,
+                                   allow_redirects=False):
+        pass
+
+
+def resolve_host(url, options=None):
+    """Resolves the host of url, warming the system's resolver cache.
+    """
+    parsed_url = urlparse(url)
+    socket.getaddrinfo(parsed_url.hostname, parsed_url.port or
+                       (443 if parsed_url.scheme == "https" else 80),
+                       type=socket.SOCK_STREAM)
+
+
+class Prewarmer():
+    """Prewarms hosts of images in background threads.
+
+    Each host is prewarmed once per PREWARM_TTL seconds by the first of
+    its urls. Errors are left to the download itself.
+    """
+
+    def __init__(self, prewarm=prewarm_connection, num_threads=4):
+        self.prewarm_url = prewarm
+        self.num_threads = num_threads
+        self.executor = None
+        self.lock = threading.Lock()
+        self.prewarmed = {}  # type: Dict[tuple, float]
+
+    def prewarm(self, img_urls, options):
+        now = time.time()
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.num_threads)
+
+            for img_url in img_urls:
+                parsed_url = urlparse(img_url)
+                key = (parsed_url.scheme, parsed_url.netloc)
+                if now - self.prewarmed.get(key, 0) < PREWARM_TTL:
+                    continue
+                self.prewarmed[key] = now
+                self.executor.submit(self.prewarm_host, img_url, options)
+
+    def prewarm_host(self, img_url, options):
+        try:
+            self.prewarm_url(img_url, options)
+        except Exception as e:
+            logging.debug(f"Prewarming {img_url} failed: {e}")
+
+    def close(self):
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
@@ -0,0 +1,43 @@
+import json
+import threading
+
+from .downloader import ImgUrlResult, PageResult, KeywordResult
+
+
+class JsonlSink():
+    """Writes a JSONL record for every image as soon as it is finished.
+
+    A record is {"type": "image", "keyword", "page", "index", "result"},
+    index being the position of the image on its page. The nested report
+    can be rebuilt from the file with yandex_images_download.report.
+    """
+
+    def __init__(self, path, mode="w"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, mode, encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def image_done(self, keyword, page, index, img_url_result: ImgUrlResult):
+        self.write({
+            "type": "image",
+            "keyword": keyword,
+            "page": page,
+            "index": index,
+            "result": img_url_result.to_record()
+        })
+
+    def page_done(self, keyword, page_result: PageResult):
+        pass
+
+    def keyword_done(self, keyword_result: KeywordResult):
+        pass
+
+    def close(self):
+        with self.lock:
+            self.file.close()
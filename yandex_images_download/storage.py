@@ -0,0 +1,83 @@
+import os
+import pathlib
+import threading
+
+from typing import Dict, Set
+
+# Layouts of the current process, by (pid, name): allocators are not shared.
+_LAYOUTS = {}  # type: Dict[tuple, object]
+_LAYOUTS_LOCK = threading.Lock()
+
+
+class FlatLayout():
+    """All images of a keyword in its directory, "name (i).ext" on clashes.
+
+    Names taken are listed once per directory and then kept in memory, so
+    allocating a name doesn't probe the disk. In multiprocess mode names
+    are prefixed with the pid, so processes never allocate the same name.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.taken = {}  # type: Dict[pathlib.Path, Set[str]]
+        self.counters = {}  # type: Dict[tuple, int]
+
+    def allocate(self, directory_path: pathlib.Path, img_path: pathlib.Path,
+                 name: str, sha256: str) -> pathlib.Path:
+        with self.lock:
+            taken = self.taken.get(directory_path)
+            if taken is None:
+                taken = self.taken[directory_path] = set(
+                    os.listdir(directory_path))
+
+            new_name = img_path.name
+            if new_name in taken:
+                key = (directory_path, name, img_path.suffix)
+                i = self.counters.get(key, 1)
+                while new_name in taken:
+                    new_name = f"{name} ({i}){img_path.suffix}"
+                    i += 1
+                self.counters[key] = i
+            taken.add(new_name)
+
+        return directory_path / new_name
+
+
+class ShardedLayout():
+    """Content addressed images in fan-out directories: ab/cd/<sha256>.ext.
+
+    With depth 2 there are 65536 leaf directories, so directories stay
+    small with millions of images, and names need no allocation. Equal
+    content gets the same path.
+    """
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.created = set()  # type: Set[pathlib.Path]
+
+    def allocate(self, directory_path: pathlib.Path, img_path: pathlib.Path,
+                 name: str, sha256: str) -> pathlib.Path:
+        shard_path = directory_path.joinpath(
+            *(sha256[2 * i:2 * i + 2] for i in range(self.depth)))
+        with self.lock:
+            if shard_path not in self.created:
+                shard_path.mkdir(parents=True, exist_ok=True)
+                self.created.add(shard_path)
+
+        return shard_path / f"{sha256}{img_path.suffix}"
+
+
+LAYOUTS = {"flat": FlatLayout, "sharded": ShardedLayout}
+
+
+def get_layout(name: str):
+    """Returns the layout of the current process, see LAYOUTS.
+    """
+    key = (os.getpid(), name)
+    with _LAYOUTS_LOCK:
+        layout = _LAYOUTS.get(key)
+        if layout is None:
+            layout = _LAYOUTS[key] = LAYOUTS[name]()
+
+    return layout
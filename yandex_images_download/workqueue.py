@@ -0,0 +1,208 @@
+"""Shows the state of a --work-queue and rebuilds the json report from it.
+
+Usage: python -m yandex_images_download.workqueue queue.db [report.json]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from typing import Dict, Iterator, List
+
+from .downloader import (ImgUrlResult, PageResult, KeywordResult,
+                         DownloaderResult, write_json)
+
+
+class WorkQueue():
+    """SQLite queue of keyword tasks shared by processes on several nodes.
+
+    A worker leases a keyword for lease_time seconds and renews the lease
+    while the keyword is in progress. A keyword whose worker died is
+    leased again once its lease expires, and a failed one is retried, up
+    to max_attempts. Results are reported as a sink of the downloader.
+    The database must be on a filesystem with working locks.
+    """
+
+    def __init__(self, path, lease_time=600, max_attempts=3):
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path),
+                                          timeout=60,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                                " keyword TEXT PRIMARY KEY,"
+                                " position INTEGER,"
+                                " state TEXT,"
+                                " attempts INTEGER,"
+                                " worker TEXT,"
+                                " lease_until REAL,"
+                                " result TEXT)")
+
+        # Keywords leased by this process.
+        self.leased = set()
+        self.stop = threading.Event()
+        self.renewer = threading.Thread(target=self.renew_leases,
+                                        daemon=True)
+        self.renewer.start()
+
+    def add(self, keywords: List[str]):
+        with self.lock:
+            (position, ) = self.connection.execute(
+                "SELECT COALESCE(MAX(position), 0) FROM tasks").fetchone()
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO tasks VALUES"
+                " (?, ?, 'pending', 0, NULL, NULL, NULL)",
+                [(keyword, position + i + 1)
+                 for i, keyword in enumerate(keywords)])
+
+    def lease(self):
+        """Returns the next keyword to do and leases it, None if none is left.
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "UPDATE tasks SET state = 'failed'"
+                    " WHERE state = 'leased' AND lease_until < ?"
+                    " AND attempts >= ?", (now, self.max_attempts))
+                row = self.connection.execute(
+                    "SELECT keyword FROM tasks"
+                    " WHERE state = 'pending'"
+                    " OR (state = 'leased' AND lease_until < ?)"
+                    " ORDER BY position LIMIT 1", (now, )).fetchone()
+                if row:
+                    self.connection.execute(
+                        "UPDATE tasks SET state = 'leased',"
+                        " attempts = attempts + 1, worker = ?,"
+                        " lease_until = ? WHERE keyword = ?",
+                        (self.worker, now + self.lease_time, row[0]))
+                    self.leased.add(row[0])
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return row[0] if row else None
+
+    def keywords(self) -> Iterator[str]:
+        """Leases keywords one at a time until the queue is done.
+        """
+        while not self.stop.is_set():
+            keyword = self.lease()
+            if keyword is None:
+                return
+            yield keyword
+
+    def renew_leases(self):
+        while not self.stop.wait(self.lease_time / 3):
+            with self.lock:
+                for keyword in self.leased:
+                    self.connection.execute(
+                        "UPDATE tasks SET lease_until = ?"
+                        " WHERE keyword = ? AND worker = ?",
+                        (time.time() + self.lease_time, keyword,
+                         self.worker))
+
+    def image_done(self, keyword, page, index, img_url_result: ImgUrlResult):
+        pass
+
+    def page_done(self, keyword, page_result: PageResult):
+        pass
+
+    def keyword_done(self, keyword_result: KeywordResult):
+        """Stores the result of a leased keyword, or puts a failed one back.
+        """
+        keyword = keyword_result.keyword
+        with self.lock:
+            if keyword not in self.leased:
+                return
+            self.leased.discard(keyword)
+
+            if keyword_result.status == "fail":
+                self.connection.execute(
+                    "UPDATE tasks SET"
+                    " state = CASE WHEN attempts >= ? THEN 'failed'"
+                    " ELSE 'pending' END,"
+                    " worker = NULL, lease_until = NULL, result = ?"
+                    " WHERE keyword = ? AND worker = ?",
+                    (self.max_attempts,
+                     json.dumps(keyword_result.to_record(),
+                                ensure_ascii=False), keyword, self.worker))
+            else:
+                self.connection.execute(
+                    "UPDATE tasks SET state = 'done', lease_until = NULL,"
+                    " result = ? WHERE keyword = ? AND worker = ?",
+                    (json.dumps(keyword_result.to_record(),
+                                ensure_ascii=False), keyword, self.worker))
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(
+                self.connection.execute(
+                    "SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+    def results(self) -> DownloaderResult:
+        """Returns results of the keywords done or failed, in queue order.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT result FROM tasks WHERE result IS NOT NULL"
+                " ORDER BY position").fetchall()
+
+        return DownloaderResult(status="success",
+                                message="Everything is downloaded!",
+                                keyword_results=[
+                                    KeywordResult.from_record(
+                                        json.loads(result))
+                                    for (result, ) in rows
+                                ])
+
+    def close(self):
+        """Puts keywords still leased, e.g. after an error, back in the queue.
+        """
+        self.stop.set()
+        self.renewer.join()
+        with self.lock:
+            for keyword in self.leased:
+                self.connection.execute(
+                    "UPDATE tasks SET state = 'pending', worker = NULL,"
+                    " lease_until = NULL WHERE keyword = ? AND worker = ?",
+                    (keyword, self.worker))
+            self.leased.clear()
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="show a work queue and rebuild the json report from it")
+    parser.add_argument("queue", help="--work-queue database", type=str)
+    parser.add_argument("json",
+                        help="report to write",
+                        type=str,
+                        nargs="?",
+                        default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    work_queue = WorkQueue(args.queue)
+    try:
+        for state, count in sorted(work_queue.counts().items()):
+            logging.info(f"{state}: {count}")
+        if args.json:
+            write_json(args.json, work_queue.results().to_record())
+            logging.info(f"Result information saved: {args.json}.")
+    finally:
+        work_queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
 import time
 import logging
-import pathlib
 import sys
 
-from multiprocessing import Pool
-from .downloader import YandexImagesDownloader, get_driver, download_single_image, save_json
+from .browsers import BrowserPool
+from .downloader import (YandexImagesDownloader, DownloadOptions,
+                         DownloaderResult, KeywordResult, save_json)
+from .engine import make_engine
+from .journal import Journal
+from .metrics import MetricsServer, MetricsWriter
 from .parse import parse_args
+from .planner import FailureStats
+from .postprocess import PostprocessOptions, Postprocessor
+from .ratelimit import RateLimiter
+from .serp import HttpSerpFetcher
+from .serp_cache import SerpCache
+from .sink import JsonlSink
+from .workqueue import WorkQueue
 
 
 def scrap(args):
@@ -20,45 +30,143 @@ def scrap(args):
         with open(args.keywords_from_file, "r") as f:
             keywords.extend([line.strip() for line in f])
 
-    driver = get_driver(args.browser, args.driver_path)
+    img_urls = []
 
-    try:
-        pool = Pool(args.num_workers) if (args.num_workers) else None
-
-        downloader = YandexImagesDownloader(driver, args.output_directory,
-                                            args.limit, args.isize,
-                                            args.exact_isize, args.iorient,
-                                            args.extension, args.color,
-                                            args.itype, args.commercial,
-                                            args.recent, pool)
+    if args.single_image:
+        img_urls.append(args.single_image)
+
+    if args.urls_from_file:
+        with open(args.urls_from_file, "r") as f:
+            img_urls.extend([line.strip() for line in f if line.strip()])
+
+    download_options = DownloadOptions(pool_maxsize=args.pool_maxsize,
+                                       retries=args.retries,
+                                       backoff_factor=args.backoff_factor,
+                                       stream=args.stream,
+                                       max_bytes=args.max_bytes,
+                                       dedup_db=args.dedup_db,
+                                       dedup_mode=args.dedup_mode,
+                                       dedup_phash=args.dedup_phash,
+                                       host_rate=args.host_rate,
+                                       layout=args.layout,
+                                       http_cache_db=args.http_cache_db,
+                                       revalidate=args.revalidate,
+                                       connect_timeout=args.connect_timeout,
+                                       ttfb_timeout=args.ttfb_timeout,
+                                       deadline=args.deadline,
+                                       hedge_percentile=args.hedge_percentile,
+                                       alternates=args.alternates,
+                                       slow_ttfb=args.slow_ttfb,
+                                       prewarm=args.prewarm)
+
+    engine = make_engine(args.engine, args.num_workers, args.concurrency)
+    journal = Journal(args.journal, args.resume) if args.journal else None
+    result_sink = JsonlSink(args.jsonl) if args.jsonl else None
+    rate_limiter = RateLimiter(args.serp_rate)
+    serp_cache = SerpCache(args.serp_cache, args.serp_cache_ttl,
+                           args.serp_cache_size) if args.serp_cache else None
+    failure_stats = FailureStats()
+    work_queue = WorkQueue(args.work_queue, args.lease_time,
+                           args.max_attempts) if args.work_queue else None
+    if work_queue:
+        work_queue.add(keywords)
+    postprocess = (args.verify_images or args.min_resolution or
+                   args.max_resolution or args.reencode or args.thumbnail_size)
+    postprocess_options = PostprocessOptions(
+        min_resolution=args.min_resolution,
+        max_resolution=args.max_resolution,
+        reencode=args.reencode,
+        thumbnail_size=args.thumbnail_size)
+    postprocessor = Postprocessor(
+        postprocess_options,
+        args.postprocess_workers) if postprocess else None
+    metrics_server = MetricsServer(
+        args.metrics_port) if args.metrics_port else None
+    metrics_writer = MetricsWriter(
+        args.metrics_json,
+        args.metrics_interval) if args.metrics_json else None
+    # Images by url are downloaded without a browser.
+    browser_pool = BrowserPool(
+        args.browser, args.driver_path, args.browsers, args.capture,
+        args.browser_profile) if keywords or work_queue else None
+
+    def make_downloader(driver):
+        serp_fetcher = HttpSerpFetcher(
+            driver, retries=args.retries,
+            backoff_factor=args.backoff_factor) if args.http_serp else None
+
+        return YandexImagesDownloader(driver, args.output_directory,
+                                      args.limit, args.isize,
+                                      args.exact_isize, args.iorient,
+                                      args.extension, args.color, args.itype,
+                                      args.commercial, args.recent, None,
+                                      download_options, engine, args.pipeline,
+                                      args.queue_size, serp_fetcher, journal,
+                                      result_sink, rate_limiter, serp_cache,
+                                      args.limit_target, failure_stats,
+                                      postprocessor, work_queue)
 
+    try:
         start_time = time.time()
         total_errors = 0
-
-        if keywords:
-            downloader_result = downloader.download_images(keywords)
+        total_downloaded = 0
+        downloader_result = DownloaderResult(
+            status="success",
+            message="Everything is downloaded!",
+            keyword_results=[])
+
+        if keywords or work_queue:
+            downloader_result = browser_pool.download_images(
+                work_queue.keywords() if work_queue else keywords,
+                make_downloader)
             total_errors += sum(
                 keyword_result.errors_count
                 for keyword_result in downloader_result.keyword_results)
+            total_downloaded += sum(
+                1 if img_url_result.status != "fail" else 0
+                for keyword_result in downloader_result.keyword_results
+                for page_result in keyword_result.page_results
+                for img_url_result in page_result.img_url_results)
+
+        if img_urls:
+            logging.info(f"Downloading {len(img_urls)} images by url...")
+            page_result = make_downloader(None).download_urls(img_urls)
+            downloader_result.keyword_results.append(
+                KeywordResult(status="success",
+                              message="All images by url downloaded!",
+                              keyword="",
+                              errors_count=page_result.errors_count,
+                              page_results=[page_result]))
+            total_errors += page_result.errors_count
+            total_downloaded += len(img_urls) - page_result.errors_count
     finally:
-        driver.quit()
-        if args.num_workers:
-            pool.close()
-            pool.join()
-
-    if args.single_image:
-        img_url_result = download_single_image(
-            args.single_image, pathlib.Path(args.output_directory))
-        total_errors += 1 if img_url_result.status == "fail" else 0
+        if browser_pool:
+            browser_pool.quit()
+        engine.close()
+        if journal:
+            journal.close()
+        if result_sink:
+            result_sink.close()
+        if serp_cache:
+            serp_cache.close()
+        if postprocessor:
+            postprocessor.close()
+        if work_queue:
+            work_queue.close()
 
     total_time = time.time() - start_time
 
     logging.info("\nEverything downloaded!")
     logging.info(f"Total errors: {total_errors}")
-    logging.info(
-        f"Total files downloaded: {len(keywords) * args.limit - total_errors}")
+    logging.info(f"Total files downloaded: {total_downloaded}")
     logging.info(f"Total time taken: {total_time} seconds.")
-    if keywords and args.json:
+
+    if metrics_writer:
+        metrics_writer.close()
+    if metrics_server:
+        metrics_server.close()
+
+    if args.json:
         save_json(args, downloader_result)
 
 